@@ -0,0 +1,173 @@
+#	rigolrdout - Read data and screenshots from Rigol oscilloscopes
+#	Copyright (C) 2012-2018 Johannes Bauer
+#
+#	This file is part of rigolrdout.
+#
+#	rigolrdout is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; this program is ONLY licensed under
+#	version 3 of the License, later versions are explicitly excluded.
+#
+#	rigolrdout is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with rigolrdout; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#	Johannes Bauer <JohannesBauer@gmx.de>
+
+import os
+import sys
+import stat
+import json
+import socket
+import threading
+import socketserver
+import concurrent.futures
+from Connections import Connection
+from RigolDriver import RigolDriver
+from Capture import Capture
+from StopWatch import StopWatch
+
+class DaemonException(Exception): pass
+
+class InstrumentSession(object):
+	# Keeps the connection to one instrument open between captures. Access is
+	# serialized, one capture at a time per instrument.
+	def __init__(self, connection_str, settings_cache = None, executor = None):
+		self._connection_str = connection_str
+		self._settings_cache = settings_cache
+		self._executor = executor
+		self._lock = threading.Lock()
+		self._conn = None
+		self._oscilloscope = None
+
+	@property
+	def connection_str(self):
+		return self._connection_str
+
+	def _connect(self):
+		self._conn = Connection.establish(self._connection_str)
+		try:
+			self._oscilloscope = RigolDriver(self._conn)
+		except:
+			self.close()
+			raise
+
+	def connect(self):
+		with self._lock:
+			if self._conn is None:
+				self._connect()
+
+	def close(self):
+		if self._conn is not None:
+			self._conn.close()
+		self._conn = None
+		self._oscilloscope = None
+
+	def capture(self, request):
+		output_format = request.get("output_format", "files")
+		with self._lock:
+			if self._conn is None:
+				self._connect()
+			try:
+				outfile = Capture(self._oscilloscope, self._connection_str).acquire(comment = request.get("comment"), include_hardcopy = request.get("include_hardcopy", False), include_serial = not request.get("no_serial", False), settings_cache = self._settings_cache, refresh_settings = request.get("refresh_settings", False), output_format = output_format, output = request["output"], executor = self._executor, retries = request.get("retries", 3), checkpoint = request["output"] if request.get("checkpoint", False) else None, max_memory = request.get("max_memory"), rearm = request.get("rearm", False))
+			except:
+				# State of the connection is unknown, start over next time.
+				self.close()
+				raise
+		# Finishing the output is done outside of the lock so that the next
+		# capture on this instrument can already start.
+		try:
+			outfile.write(output_format, request["output"])
+			if request.get("pyramid", False):
+				outfile.write_pyramid(output_format, request["output"])
+		finally:
+			outfile.close()
+
+class AcquisitionRequestHandler(socketserver.StreamRequestHandler):
+	def _handle_request(self, request):
+		if "connect" not in request:
+			raise DaemonException("Request does not specify an instrument to connect to.")
+		if ("output" not in request) or (not os.path.isabs(request["output"])):
+			raise DaemonException("Request needs an absolute output filename.")
+		session = self.server.sessions.get(Connection.normalize(request["connect"]))
+		if session is None:
+			raise DaemonException("Instrument %s is not handled by this daemon." % (request["connect"]))
+		stopwatch = StopWatch()
+		session.capture(request)
+		return {
+			"status":	"ok",
+			"duration":	stopwatch.stop(),
+		}
+
+	def handle(self):
+		for line in self.rfile:
+			try:
+				response = self._handle_request(json.loads(line.decode("utf-8")))
+			except Exception as e:
+				response = {
+					"status":	"error",
+					"message":	"%s: %s" % (e.__class__.__name__, str(e)),
+				}
+			self.wfile.write((json.dumps(response) + "\n").encode("utf-8"))
+			self.wfile.flush()
+
+class AcquisitionDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+	daemon_threads = True
+
+	def __init__(self, socket_path, connection_strs, settings_cache = None, workers = 4):
+		self._executor = concurrent.futures.ThreadPoolExecutor(max_workers = workers)
+		# Sessions are looked up by normalized connection string, so that
+		# e.g. "TCPIP:scope" and "tcpip:scope" refer to the same instrument
+		self.sessions = { Connection.normalize(connection_str): InstrumentSession(connection_str, settings_cache = settings_cache, executor = self._executor) for connection_str in connection_strs }
+		self._remove_stale_socket(socket_path)
+		socketserver.UnixStreamServer.__init__(self, socket_path, AcquisitionRequestHandler)
+
+	@staticmethod
+	def _remove_stale_socket(socket_path):
+		# A daemon that was killed leaves its socket behind. It is only
+		# removed if nobody is listening on it anymore.
+		if not os.path.exists(socket_path):
+			return
+		if not stat.S_ISSOCK(os.stat(socket_path).st_mode):
+			raise DaemonException("%s exists and is not a socket." % (socket_path))
+		with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+			try:
+				sock.connect(socket_path)
+			except ConnectionRefusedError:
+				os.unlink(socket_path)
+				return
+		raise DaemonException("Another daemon is already listening on %s." % (socket_path))
+
+	def connect_all(self):
+		for session in self.sessions.values():
+			try:
+				session.connect()
+			except Exception as e:
+				print("Could not connect to %s, will retry on first request: %s" % (session.connection_str, str(e)), file = sys.stderr)
+
+	def server_close(self):
+		socketserver.UnixStreamServer.server_close(self)
+		os.unlink(self.server_address)
+		for session in self.sessions.values():
+			session.close()
+		self._executor.shutdown()
+
+class DaemonClient(object):
+	def __init__(self, socket_path):
+		self._socket_path = socket_path
+
+	def capture(self, request):
+		with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+			sock.connect(self._socket_path)
+			with sock.makefile("rwb") as f:
+				f.write((json.dumps(request) + "\n").encode("utf-8"))
+				f.flush()
+				response = json.loads(f.readline().decode("utf-8"))
+		if response["status"] != "ok":
+			raise DaemonException(response["message"])
+		return response
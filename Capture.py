@@ -0,0 +1,88 @@
+#	rigolrdout - Read data and screenshots from Rigol oscilloscopes
+#	Copyright (C) 2012-2018 Johannes Bauer
+#
+#	This file is part of rigolrdout.
+#
+#	rigolrdout is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; this program is ONLY licensed under
+#	version 3 of the License, later versions are explicitly excluded.
+#
+#	rigolrdout is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with rigolrdout; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#	Johannes Bauer <JohannesBauer@gmx.de>
+
+from OutputFile import OutputFile
+from Profiler import Profiler
+
+class Capture(object):
+	# Rough number of copies of a waveform that are in memory at the same time
+	# while it is hashed, compressed, encoded and written.
+	_IN_MEMORY_COPIES = 4
+
+	def __init__(self, oscilloscope, connection_str):
+		self._oscilloscope = oscilloscope
+		self._connection_str = connection_str
+
+	def acquire(self, comment = None, include_hardcopy = False, include_serial = True, settings_cache = None, refresh_settings = False, output_format = None, output = None, executor = None, retries = 3, checkpoint = None, max_memory = None, rearm = False):
+		# If output format, filename and an executor are given, every chunk
+		# of raw data is post-processed in the background while the next one
+		# is still transferring. It still needs to be written by the caller.
+		# If checkpoint is given, it is a filename prefix under which partial
+		# waveform transfers are saved and resumed from. They are removed when
+		# the output file has been written successfully. If max_memory (in
+		# bytes) is given, waveforms that would not fit into it are spooled to
+		# disk next to the output file instead. Acquisition is stopped for the
+		# capture; with rearm, it is started again afterwards (as a single
+		# shot if that is the configured sweep mode).
+		outfile = OutputFile(include_serial = include_serial, executor = executor)
+		if (output_format is not None) and (output is not None):
+			outfile.prepare(output_format, output)
+		outfile.connection = self._connection_str
+		outfile.instrument = self._oscilloscope.identification
+		with Profiler.stage("stop"):
+			self._oscilloscope.stop()
+		with Profiler.stage("settings"):
+			if settings_cache is not None:
+				(outfile.channel_info, outfile.acquisition_info) = settings_cache.get_settings(self._oscilloscope, refresh = refresh_settings)
+			else:
+				outfile.channel_info = self._oscilloscope.get_enabled_channel_info()
+				outfile.acquisition_info = self._oscilloscope.get_acquisition_info()
+		outfile.comment = comment
+		if (max_memory is not None) and (output is not None):
+			max_in_memory = max_memory // (self._IN_MEMORY_COPIES * max(len(outfile.channel_info), 1))
+		else:
+			max_in_memory = None
+		try:
+			for channel_id in outfile.channel_info.keys():
+				checkpoint_filename = None if (checkpoint is None) else "%s_ch%d.partial" % (checkpoint, channel_id)
+				spool_filename = None if (max_in_memory is None) else "%s_ch%d.spool" % (output, channel_id)
+				with Profiler.stage("transfer waveform-ch%d" % (channel_id)):
+					waveform = self._oscilloscope.get_waveform(channel_id, retries = retries, checkpoint_filename = checkpoint_filename, spool_filename = spool_filename, max_in_memory = max_in_memory)
+				if checkpoint_filename is not None:
+					outfile.add_checkpoint(checkpoint_filename)
+				outfile.add_raw_data("waveform-ch%d" % (channel_id), waveform)
+			# Acquisition is stopped, so the screen does not change anymore. Reading
+			# the hardcopy last lets it overlap with processing the last channel.
+			if include_hardcopy:
+				with Profiler.stage("transfer hardcopy"):
+					hardcopy = self._oscilloscope.get_display_data(img_format = "png")
+				outfile.add_raw_data("hardcopy", hardcopy)
+			if rearm:
+				with Profiler.stage("rearm"):
+					if outfile.acquisition_info["trigger"]["sweep"].upper().startswith("SING"):
+						self._oscilloscope.single()
+					else:
+						self._oscilloscope.run()
+		except:
+			# Discards all raw data transferred so far, including spool files
+			outfile.close()
+			raise
+		return outfile
@@ -24,6 +24,8 @@ import socket
 import threading
 from DataBuffer import DataBuffer
 
+class ProtocolException(Exception): pass
+
 class BaseConnection(object):
 	def __init__(self):
 		self.__buffer = DataBuffer()
@@ -45,18 +47,26 @@ class BaseConnection(object):
 	def get(self, length, timeout = 1.0):
 		return self.__buffer.get(length, timeout = timeout)
 
+	def drain(self, quiet_time = 0.5):
+		return self.__buffer.drain(quiet_time = quiet_time)
+
 	def get_tmc_data(self, timeout = 5.0):
 		header = self.__buffer.get(2)
-		assert(header[0] == ord("#"))
+		if (header[0] != ord("#")) or (not chr(header[1]).isdigit()):
+			raise ProtocolException("Expected TMC block header, but received %s." % (str(bytes(header))))
 		digit_count = int(chr(header[1]))
 		data_length = self.__buffer.get(digit_count)
-		data_length = int(data_length.decode("ascii"))
+		try:
+			data_length = int(data_length.decode("ascii"))
+		except ValueError:
+			raise ProtocolException("Invalid TMC block length %s." % (str(bytes(data_length))))
 		data = self.__buffer.get(data_length, timeout = timeout)
 
 		# Yes, that's pretty stupid. But it sends a newline after binary,
 		# length-delimited data.
 		newline = self.__buffer.get(1)
-		assert(newline[0] == 10)
+		if newline[0] != 10:
+			raise ProtocolException("TMC block not terminated by newline.")
 
 		return data
 
@@ -99,16 +109,30 @@ class TCPIPConnection(BaseConnection):
 		conn_str = conn_str.split(":")
 		return cls(conn_str[1])
 
+	@classmethod
+	def normalize_str(cls, conn_str):
+		# Driver and host names are case-insensitive
+		return conn_str.lower()
+
 class Connection(object):
 	_ConnectionClasses = {
 		"tcpip":	TCPIPConnection,
 	}
 
 	@classmethod
-	def establish(cls, conn_str):
+	def _connection_class(cls, conn_str):
 		if len(conn_str) == 0:
 			raise Exception("Connection string is a required argument.")
 		driver = conn_str.split(":")[0].lower()
 		if driver not in cls._ConnectionClasses:
 			raise Exception("No such driver type: %s" % (driver))
-		return cls._ConnectionClasses[driver].from_str(conn_str)
+		return cls._ConnectionClasses[driver]
+
+	@classmethod
+	def establish(cls, conn_str):
+		return cls._connection_class(conn_str).from_str(conn_str)
+
+	@classmethod
+	def normalize(cls, conn_str):
+		# Equal for all connection strings that refer to the same instrument
+		return cls._connection_class(conn_str).normalize_str(conn_str)
@@ -33,6 +33,17 @@ class DataBuffer(object):
 		with self._cond:
 			print(self._buf)
 
+	def drain(self, quiet_time = 0.5):
+		# Discards everything that is buffered or still arriving, until no
+		# new data has come in for quiet_time seconds.
+		discarded = 0
+		with self._cond:
+			while True:
+				discarded += len(self._buf)
+				self._buf = bytearray()
+				if not self._cond.wait(timeout = quiet_time):
+					return discarded
+
 	def put(self, data):
 		with self._cond:
 			self._buf += data
@@ -53,7 +64,7 @@ class DataBuffer(object):
 					if remaining > 0:
 						self._cond.wait(timeout = remaining)
 					else:
-						raise DataBufferTimeout("Timeout waiting for %d bytes of data line (%.1f sec)" % (timeout))
+						raise DataBufferTimeout("Timeout waiting for %d bytes of data (%.1f sec)" % (length, timeout))
 
 	def getline(self, codec = None, timeout = 1.0):
 		end = time.time() + timeout
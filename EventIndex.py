@@ -0,0 +1,189 @@
+#	rigolrdout - Read data and screenshots from Rigol oscilloscopes
+#	Copyright (C) 2012-2018 Johannes Bauer
+#
+#	This file is part of rigolrdout.
+#
+#	rigolrdout is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; this program is ONLY licensed under
+#	version 3 of the License, later versions are explicitly excluded.
+#
+#	rigolrdout is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with rigolrdout; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#	Johannes Bauer <JohannesBauer@gmx.de>
+
+import os
+import json
+import numpy
+from WaveformData import WaveformData
+from InputFile import InputFile
+
+class EventIndexException(Exception): pass
+
+class EventIndex(object):
+	# Pulses and runts of every channel of a capture. Stored next to it as an
+	# index (_events.json) and the event arrays (_events.bin): for every
+	# channel and kind of event, the start times and widths as float64 and
+	# the polarities as one byte each.
+	#
+	# Reference levels (fraction of the base-to-top amplitude) at which
+	# pulses and runts are detected.
+	_LOW_REFERENCE = 0.1
+	_MID_REFERENCE = 0.5
+	_HIGH_REFERENCE = 0.9
+	_KINDS = ("pulses", "runts")
+
+	def __init__(self, content, events):
+		self._content = content
+		self._events = events
+
+	@staticmethod
+	def sidecar_filenames(capture_filename):
+		return (InputFile.sidecar_filename(capture_filename, "_events.json"), InputFile.sidecar_filename(capture_filename, "_events.bin"))
+
+	@classmethod
+	def _pulses(cls, waveform, t_mid, rising):
+		# Consecutive transitions at one level delimit a pulse; its polarity
+		# is given by the edge that starts it. The edges themselves are the
+		# pulse starts and the end of the last pulse.
+		return (waveform.to_seconds(t_mid[:-1]), numpy.diff(t_mid) * waveform.x_increment, rising[:-1])
+
+	@classmethod
+	def _mid_crossings(cls, waveform, low_code, high_code):
+		(t_leave, t_arrive, rising) = waveform.find_transitions(low_code, high_code)
+		return ((t_leave + t_arrive) / 2, rising)
+
+	@classmethod
+	def _runts(cls, waveform, base_code, top_code, hysteresis_code):
+		# A positive runt leaves the base level but falls back to it before
+		# reaching the top level, a negative runt does the same the other way
+		# around.
+		amplitude = top_code - base_code
+		low_code = base_code + cls._LOW_REFERENCE * amplitude
+		high_code = base_code + cls._HIGH_REFERENCE * amplitude
+		(t_low, rising_low) = cls._mid_crossings(waveform, low_code - hysteresis_code / 2, low_code + hysteresis_code / 2)
+		(t_high, rising_high) = cls._mid_crossings(waveform, high_code - hysteresis_code / 2, high_code + hysteresis_code / 2)
+
+		(starts, widths, polarities) = ([ ], [ ], [ ])
+		for (positive, t_edges, starts_pulse, t_other) in ((True, t_low, rising_low, t_high), (False, t_high, ~rising_high, t_low)):
+			if len(t_edges) < 2:
+				continue
+			(start, end) = (t_edges[:-1], t_edges[1:])
+			crossed_other = numpy.searchsorted(t_other, start) != numpy.searchsorted(t_other, end)
+			is_runt = starts_pulse[:-1] & ~crossed_other
+			starts.append(waveform.to_seconds(start[is_runt]))
+			widths.append((end[is_runt] - start[is_runt]) * waveform.x_increment)
+			polarities.append(numpy.full(int(is_runt.sum()), positive))
+		return cls._concatenate(starts, widths, polarities)
+
+	@staticmethod
+	def _concatenate(starts, widths, polarities):
+		return (numpy.concatenate([ numpy.zeros(0) ] + starts), numpy.concatenate([ numpy.zeros(0) ] + widths), numpy.concatenate([ numpy.zeros(0, dtype = bool) ] + polarities))
+
+	@classmethod
+	def _index_waveform(cls, waveform, threshold = None, hysteresis = 0.05):
+		# The samples are swept only once, for the histogram (see
+		# WaveformData); the transition searches at the detection levels only
+		# revisit the few blocks of samples around edges.
+		(base_code, top_code) = waveform.base_top_codes()
+		amplitude = top_code - base_code
+		hysteresis_code = max(hysteresis * amplitude, 1)
+		if threshold is None:
+			threshold_code = base_code + cls._MID_REFERENCE * amplitude
+		else:
+			threshold_code = waveform.to_code(threshold)
+
+		(t_mid, rising) = cls._mid_crossings(waveform, threshold_code - hysteresis_code / 2, threshold_code + hysteresis_code / 2)
+		content = {
+			"threshold":	float(waveform.to_volts(threshold_code)),
+			"hysteresis":	hysteresis_code * abs(waveform.y_increment),
+		}
+		events = {
+			"pulses":		cls._pulses(waveform, t_mid, rising),
+			"runts":		cls._concatenate([ ], [ ], [ ]),
+		}
+		if (threshold is None) and (amplitude >= 2):
+			events["runts"] = cls._runts(waveform, base_code, top_code, hysteresis_code)
+		return (content, events)
+
+	@classmethod
+	def create(cls, inputfile, threshold = None, hysteresis = 0.05):
+		content = {
+			"capture":	os.path.basename(inputfile.filename),
+			"created":	inputfile.get("created"),
+			"comment":	inputfile.get("comment"),
+			"channels":	{ },
+		}
+		events = { }
+		for waveform in WaveformData.iter_input(inputfile):
+			channel_id = str(waveform.channel)
+			(content["channels"][channel_id], channel_events) = cls._index_waveform(waveform, threshold = threshold, hysteresis = hysteresis)
+			for (kind, kind_events) in channel_events.items():
+				events[(channel_id, kind)] = kind_events
+		return cls(content, events)
+
+	@classmethod
+	def load(cls, index_filename):
+		with open(index_filename) as f:
+			content = json.load(f)
+		if "data" not in content:
+			raise EventIndexException("%s is not an event index of this version, recreate it with \"rigolevents index -f\"." % (index_filename))
+		data_filename = os.path.join(os.path.dirname(index_filename), content["data"])
+		events = { }
+		for (channel_id, channel_content) in content["channels"].items():
+			for kind in cls._KINDS:
+				(count, offset) = (channel_content[kind]["count"], channel_content[kind]["offset"])
+				start = numpy.fromfile(data_filename, dtype = numpy.float64, count = count, offset = offset)
+				width = numpy.fromfile(data_filename, dtype = numpy.float64, count = count, offset = offset + 8 * count)
+				positive = numpy.fromfile(data_filename, dtype = numpy.uint8, count = count, offset = offset + 16 * count).astype(bool)
+				events[(channel_id, kind)] = (start, width, positive)
+		return cls(content, events)
+
+	def write(self, index_filename, data_filename):
+		content = dict(self._content)
+		content["data"] = os.path.basename(data_filename)
+		content["channels"] = { channel_id: dict(channel_content) for (channel_id, channel_content) in self._content["channels"].items() }
+		with open(data_filename, "wb") as f:
+			for (channel_id, channel_content) in sorted(content["channels"].items()):
+				for kind in self._KINDS:
+					(start, width, positive) = self._events[(channel_id, kind)]
+					channel_content[kind] = {
+						"count":	len(start),
+						"offset":	f.tell(),
+					}
+					f.write(numpy.asarray(start, dtype = numpy.float64).tobytes())
+					f.write(numpy.asarray(width, dtype = numpy.float64).tobytes())
+					f.write(numpy.asarray(positive, dtype = numpy.uint8).tobytes())
+		with open(index_filename, "w") as f:
+			json.dump(content, f, sort_keys = True)
+
+	@property
+	def capture(self):
+		return self._content["capture"]
+
+	@property
+	def created(self):
+		return self._content["created"]
+
+	def query(self, channel = None, kind = "pulses", polarity = None, min_width = None, max_width = None):
+		# Yields (channel, start, width, positive) for every matching event
+		for channel_id in sorted(self._content["channels"]):
+			if (channel is not None) and (int(channel_id) != channel):
+				continue
+			(start, width, positive) = self._events[(channel_id, kind)]
+			selected = numpy.ones(len(start), dtype = bool)
+			if polarity is not None:
+				selected &= (positive == (polarity == "pos"))
+			if min_width is not None:
+				selected &= (width >= min_width)
+			if max_width is not None:
+				selected &= (width <= max_width)
+			for (event_start, event_width, event_positive) in zip(start[selected], width[selected], positive[selected]):
+				yield (int(channel_id), float(event_start), float(event_width), bool(event_positive))
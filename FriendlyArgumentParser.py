@@ -57,6 +57,59 @@ def baseint(value, default_base = 10):
 	else:
 		return int(value, default_base)
 
+def sifloat(value):
+	# Accepts values with an SI prefix, e.g. "50n" or "1.5k"
+	prefixes = {
+		"p":	1e-12,
+		"n":	1e-9,
+		"u":	1e-6,
+		"µ":	1e-6,
+		"m":	1e-3,
+		"k":	1e3,
+		"M":	1e6,
+		"G":	1e9,
+	}
+	if (len(value) > 0) and (value[-1] in prefixes):
+		return float(value[:-1]) * prefixes[value[-1]]
+	else:
+		return float(value)
+
+def sirange(value):
+	# Two sifloat values separated by a colon, e.g. "-10u:20u"
+	if value.count(":") != 1:
+		raise argparse.ArgumentTypeError("'%s' is not a range of the form start:end." % (value))
+	(start, end) = (sifloat(part) for part in value.split(":"))
+	if end <= start:
+		raise argparse.ArgumentTypeError("End of range '%s' is not after its start." % (value))
+	return (start, end)
+
+def bytesize(value):
+	# Accepts sizes with a binary suffix, e.g. "256M" or "2G"
+	suffixes = {
+		"k":	1024,
+		"K":	1024,
+		"M":	1024 ** 2,
+		"G":	1024 ** 3,
+	}
+	if (len(value) > 0) and (value[-1] in suffixes):
+		return int(float(value[:-1]) * suffixes[value[-1]])
+	else:
+		return int(value)
+
+def positiveint(value):
+	result = int(value)
+	if result < 1:
+		raise argparse.ArgumentTypeError("%d is not a positive number." % (result))
+	return result
+
+def fftsize(value):
+	# A power of two of at least four samples; the window functions are zero
+	# at both ends, so shorter blocks would carry no signal at all.
+	size = int(value)
+	if (size < 4) or (size & (size - 1)) != 0:
+		raise argparse.ArgumentTypeError("FFT size %d is not a power of two of at least 4." % (size))
+	return size
+
 if __name__ == "__main__":
 	parser = FriendlyArgumentParser()
 	parser.add_argument("-d", "--dbfile", metavar = "filename", type = str, default = "mydb.sqlite", help = "Specifies database file to use. Defaults to %(default)s.")
@@ -0,0 +1,74 @@
+#	rigolrdout - Read data and screenshots from Rigol oscilloscopes
+#	Copyright (C) 2012-2018 Johannes Bauer
+#
+#	This file is part of rigolrdout.
+#
+#	rigolrdout is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; this program is ONLY licensed under
+#	version 3 of the License, later versions are explicitly excluded.
+#
+#	rigolrdout is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with rigolrdout; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#	Johannes Bauer <JohannesBauer@gmx.de>
+
+import tempfile
+import subprocess
+from Profiler import Profiler
+
+class GnuplotRenderer(object):
+	_COLORS = {
+		0:	"f1c40f",	# yellow
+		1:	"3498db",	# blue
+		2:	"e82dc6",	# pink
+		3:	"8e44ad",	# purple
+	}
+
+	def __init__(self, args, inputfile):
+		self._args = args
+		self._input = inputfile
+
+	def _waveform_color(self, channel_id):
+		return self._COLORS[(channel_id - 1) % len(self._COLORS)]
+
+	@staticmethod
+	def _get_unit(unit):
+		if unit is None:
+			return ("", 1)
+		return {
+			"m":	("m", 1e-3),
+			"u":	("µ", 1e-6),
+			"n":	("n", 1e-9),
+		}[unit]
+
+	def _write_gpl_header(self, f):
+		print("set terminal pngcairo size %s,%s" % (self._args.width, self._args.height), file = f)
+		if self._input.get("comment"):
+			print("set title \"%s\"" % (self._input["comment"]), file = f)
+		else:
+			print("set title \"%s %s\"" % (self._input["instrument"]["vendor"], self._input["instrument"]["device"]), file = f)
+
+	def write_gpl(self, f):
+		raise Exception(NotImplemented)
+
+	def write(self, filename, out_format):
+		assert(out_format in [ "gnuplot", "png" ])
+		if out_format == "gnuplot":
+			with open(filename, "w") as f, Profiler.stage("render gnuplot"):
+				self.write_gpl(f)
+		elif out_format == "png":
+			with tempfile.NamedTemporaryFile(prefix = "plot_", suffix = ".gpl", mode = "w") as f:
+				with Profiler.stage("render gnuplot"):
+					self.write_gpl(f)
+					f.flush()
+				with Profiler.stage("run gnuplot"):
+					png = subprocess.check_output([ "gnuplot", f.name ])
+			with open(filename, "wb") as f:
+				f.write(png)
@@ -20,26 +20,23 @@
 #	Johannes Bauer <JohannesBauer@gmx.de>
 
 import os
+import re
 import json
 import base64
 import gzip
+import zlib
 import hashlib
-import sys
+import mmap
 import tempfile
-import subprocess
+import sys
+from GnuplotRenderer import GnuplotRenderer
+from Profiler import Profiler
 
 class UnableToLoadStorageException(Exception): pass
 
-class RigolWaveformInterpreter(object):
-	_COLORS = {
-		0:	"f1c40f",	# yellow
-		1:	"3498db",	# blue
-		2:	"e82dc6",	# pink
-		3:	"8e44ad",	# purple
-	}
+class RigolWaveformInterpreter(GnuplotRenderer):
 	def __init__(self, args, inputfile):
-		self._args = args
-		self._input = inputfile
+		GnuplotRenderer.__init__(self, args, inputfile)
 		self._waveforms  = list(self._input.iter_waveform())
 
 	def _interpret_waveform(self, waveform):
@@ -50,29 +47,27 @@ class RigolWaveformInterpreter(object):
 			y = (value - meta["y_origin"]["flt"] - meta["y_reference"]) * meta["y_increment"]["flt"]
 			yield (x, y)
 
-	def _waveform_color(self, channel_id):
-		return self._COLORS[(channel_id - 1) % len(self._COLORS)]
-
-	@staticmethod
-	def _get_unit(unit):
-		if unit is None:
-			return ("", 1)
-		return {
-			"m":	("m", 1e-3),
-			"u":	("µ", 1e-6),
-			"n":	("n", 1e-9),
-		}[unit]
+	def _plot_columns(self, meta, xunit_value, yunit_value, y_columns = 1):
+		# Expressions for the time column and the following y_columns voltage
+		# columns, scaled to the plot units.
+		if not self._args.honor_offsets:
+			(xplot, yplots) = ("$1", [ "$%d" % (i) for i in range(2, y_columns + 2) ])
+		else:
+			channel_id = str(meta["channel"])
+			xplot = "$1-%f" % (self._input["acquisition_info"]["timebase"]["offset"]["flt"])
+			yplots = [ "$%d+%f" % (i, self._input["channel_info"][channel_id]["offset"]["flt"]) for i in range(2, y_columns + 2) ]
+		if xunit_value != 1:
+			xplot = "(%s)/%e" % (xplot, xunit_value)
+		if yunit_value != 1:
+			yplots = [ "(%s)/%e" % (yplot, yunit_value) for yplot in yplots ]
+		return [ xplot ] + yplots
 
 	def write_gpl(self, f):
 		(xunit, xunit_value) = self._get_unit(self._args.x_unit)
 		(yunit, yunit_value) = self._get_unit(self._args.y_unit)
 
 		print("# %d waveform(s)" % (len(self._waveforms)), file = f)
-		print("set terminal pngcairo size %s,%s" % (self._args.width, self._args.height), file = f)
-		if self._input.get("comment"):
-			print("set title \"%s\"" % (self._input["comment"]), file = f)
-		else:
-			print("set title \"%s %s\"" % (self._input["instrument"]["vendor"], self._input["instrument"]["device"]), file = f)
+		self._write_gpl_header(f)
 		print("set xlabel \"x / %ss\"" % (xunit), file = f)
 		print("set ylabel \"y / %sV\"" % (yunit), file = f)
 		print("set ytics nomirror", file = f)
@@ -81,18 +76,7 @@ class RigolWaveformInterpreter(object):
 		plotcmds = [ ]
 		for (name, meta, data) in self._waveforms:
 			single_cmd = [ "'-' using" ]
-
-			if not self._args.honor_offsets:
-				(xplot, yplot) = ("$1", "$2")
-			else:
-				channel_id = str(meta["channel"])
-				xplot = "$1-%f" % (self._input["acquisition_info"]["timebase"]["offset"]["flt"])
-				yplot = "$2+%f" % (self._input["channel_info"][channel_id]["offset"]["flt"])
-			if xunit_value != 1:
-				xplot = "(%s)/%e" % (xplot, xunit_value)
-			if yunit_value != 1:
-				yplot = "(%s)/%e" % (yplot, yunit_value)
-			single_cmd.append("(%s):(%s)" % (xplot, yplot))
+			single_cmd.append(":".join("(%s)" % (column) for column in self._plot_columns(meta, xunit_value, yunit_value)))
 
 			single_cmd.append("with lines")
 			if self._args.smooth_waveform:
@@ -110,41 +94,117 @@ class RigolWaveformInterpreter(object):
 			print("end", file = f)
 			print(file = f)
 
-	def write(self, filename, out_format):
-		assert(out_format in [ "gnuplot", "png" ])
-		if out_format == "gnuplot":
-			with open(filename, "w") as f:
-				self.write_gpl(f)
-		elif out_format == "png":
-			with tempfile.NamedTemporaryFile(prefix = "plot_", suffix = ".gpl", mode = "w") as f:
-				self.write_gpl(f)
-				f.flush()
-				png = subprocess.check_output([ "gnuplot", f.name ])
-			with open(filename, "wb") as f:
-				f.write(png)
-
 class InputFile(object):
-	def __init__(self, args, filename):
+	_CHUNK_SIZE = 1024 * 1024
+	_INLINE_DATA_REGEX = re.compile(rb"\"gzip_compressed_data\"\s*:\s*\"")
+	_INLINE_DATA_LOOKBEHIND = 64
+
+	def __init__(self, args, filename, metadata_only = False):
 		self._args = args
-		with open(filename) as f:
-			self._meta = json.loads(f.read())
-		self._storage = self._load_storage()
-
-	def _load_storage(self):
-		storage = { }
-		for (blob_name, blob_data) in self._meta["data"].items():
-			try:
-				data = self._load_blob(blob_data)
-				storage[blob_name] = data
-			except UnableToLoadStorageException as e:
-				print("Cannot load storage %s: %s -- ignoring this data chunk." % (blob_name, str(e)))
-		return storage
-
-	def _load_blob(self, blob_data):
+		self._filename = filename
+		self._inline_spool = None
+		self._spooled_values = { }
+		if metadata_only:
+			self._meta = self._read_spooled_meta(filename, spool = False)
+		elif args.max_memory is None:
+			with open(filename) as f:
+				self._meta = json.loads(f.read())
+		else:
+			self._meta = self._read_spooled_meta(filename)
+		self._storage = { }
+		self._in_memory = 0
+
+	@staticmethod
+	def sidecar_filename(capture_filename, suffix):
+		# Files derived from a capture (event index, pyramid) are stored next
+		# to it, named after the capture.
+		if capture_filename.endswith("_meta.json"):
+			base = capture_filename[: -len("_meta.json")]
+		elif capture_filename.endswith(".json"):
+			base = capture_filename[: -len(".json")]
+		else:
+			base = capture_filename
+		return base + suffix
+
+	def _read_spooled_meta(self, filename, spool = True):
+		# Copies the encoded data of inline blobs to a temporary file while
+		# reading, so that only the remaining metadata is parsed in memory.
+		# The value is replaced by a placeholder that cannot occur in base64
+		# and that refers to (offset, length) in that file. Base64 contains no
+		# quotes, so the first quote ends the value. Values that are not found
+		# this way stay in memory. Without spool, the data is skipped and
+		# cannot be loaded afterwards.
+		if spool:
+			self._inline_spool = tempfile.TemporaryFile()
+		text = bytearray()
+		pending = b""
+		in_value = False
+		position = 0
+		with open(filename, "rb") as f:
+			for chunk in self._iter_file_chunks(f, self._CHUNK_SIZE):
+				pending += chunk
+				while len(pending) > 0:
+					if in_value:
+						index = pending.find(b"\"")
+						value = pending if (index == -1) else pending[:index]
+						if self._inline_spool is not None:
+							self._inline_spool.write(value)
+						position += len(value)
+						if index == -1:
+							pending = b""
+						else:
+							placeholder = "spool:%d" % (len(self._spooled_values))
+							self._spooled_values[placeholder] = (value_offset, position - value_offset)
+							text += placeholder.encode("ascii")
+							pending = pending[index : ]
+							in_value = False
+					else:
+						match = self._INLINE_DATA_REGEX.search(pending)
+						if match is None:
+							# Keep enough to find a token split across chunks
+							keep = max(len(pending) - self._INLINE_DATA_LOOKBEHIND, 0)
+							text += pending[:keep]
+							pending = pending[keep : ]
+							break
+						text += pending[ : match.end()]
+						pending = pending[match.end() : ]
+						value_offset = position
+						in_value = True
+		text += pending
+		return json.loads(text.decode("utf-8"))
+
+	def get_storage(self, blob_name):
+		# Blobs are only decoded when they are first accessed. Returns None if
+		# the blob cannot be loaded.
+		if blob_name not in self._storage:
+			self._storage[blob_name] = self._load_storage(blob_name, self._meta["data"][blob_name])
+		return self._storage[blob_name]
+
+	def _load_storage(self, blob_name, blob_data):
+		# With a memory budget, blobs are only read into memory as long as
+		# they fit into a quarter of it. Larger ones are mapped from their
+		# file (after decompressing them into a temporary file if needed), so
+		# that they are paged in and out by the operating system.
+		max_memory = self._args.max_memory
+		mapped = (max_memory is not None) and (self._in_memory + blob_data["length"] > max_memory // 4)
+		try:
+			with Profiler.stage("decode %s" % (blob_name)):
+				data = self._load_blob(blob_data, mapped)
+		except UnableToLoadStorageException as e:
+			print("Cannot load storage %s: %s -- ignoring this data chunk." % (blob_name, str(e)))
+			return None
+		if not mapped:
+			self._in_memory += blob_data["length"]
+		return data
+
+	def _load_blob(self, blob_data, mapped = False):
 		if blob_data["storage"] == "inline":
-			data = self._load_inline_blob(blob_data)
+			if mapped:
+				data = self._map_inline_blob(blob_data)
+			else:
+				data = self._load_inline_blob(blob_data)
 		elif blob_data["storage"] == "external":
-			data = self._load_external_blob(blob_data)
+			data = self._load_external_blob(blob_data, mapped)
 		else:
 			raise UnableToLoadStorageException("Unknown storage format '%s'." % (blob_data["storage"]))
 		hashval = hashlib.sha256(data).hexdigest()
@@ -152,33 +212,129 @@ class InputFile(object):
 			raise UnableToLoadStorageException("SHA256 of blob does not match recorded data. Tampered/corrupt data or wrong file reference.")
 		return data
 
+	@staticmethod
+	def _map_file(f):
+		if os.fstat(f.fileno()).st_size == 0:
+			return b""
+		return memoryview(mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ))
+
+	def _map_chunks(self, chunks):
+		with tempfile.TemporaryFile() as f:
+			for chunk in chunks:
+				f.write(chunk)
+			f.flush()
+			return self._map_file(f)
+
+	def _iter_encoded_data(self, blob_data, step):
+		encoded_data = blob_data["gzip_compressed_data"]
+		if encoded_data not in self._spooled_values:
+			for offset in range(0, len(encoded_data), step):
+				yield encoded_data[offset : offset + step]
+		else:
+			if self._inline_spool is None:
+				raise UnableToLoadStorageException("Only the metadata of %s has been read." % (self._filename))
+			(offset, length) = self._spooled_values[encoded_data]
+			self._inline_spool.seek(offset)
+			for position in range(0, length, step):
+				yield self._inline_spool.read(min(step, length - position))
+
+	def _iter_inline_chunks(self, blob_data):
+		# Base64 decodes in multiples of four characters, gzip may consist of
+		# multiple members. Output is limited per step since waveforms often
+		# compress extremely well.
+		decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+		for encoded_chunk in self._iter_encoded_data(blob_data, 4 * self._CHUNK_SIZE):
+			compressed = base64.b64decode(encoded_chunk)
+			while len(compressed) > 0:
+				yield decompressor.decompress(compressed, self._CHUNK_SIZE)
+				if decompressor.eof:
+					compressed = decompressor.unused_data
+					decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+				else:
+					compressed = decompressor.unconsumed_tail
+		yield decompressor.flush()
+
+	def _map_inline_blob(self, blob_data):
+		data = self._map_chunks(self._iter_inline_chunks(blob_data))
+		# The encoded data is not needed anymore once it has been decoded
+		del blob_data["gzip_compressed_data"]
+		return data
+
 	def _load_inline_blob(self, blob_data):
-		return gzip.decompress(base64.b64decode(blob_data["gzip_compressed_data"]))
+		encoded_data = blob_data["gzip_compressed_data"]
+		if encoded_data in self._spooled_values:
+			encoded_data = b"".join(self._iter_encoded_data(blob_data, 4 * self._CHUNK_SIZE))
+		return gzip.decompress(base64.b64decode(encoded_data))
 
-	def _load_external_blob(self, blob_data):
+	@staticmethod
+	def _iter_file_chunks(f, chunk_size):
+		while True:
+			chunk = f.read(chunk_size)
+			if len(chunk) == 0:
+				break
+			yield chunk
+
+	def _external_filename(self, blob_data):
 		if self._args.search_path is not None:
 			search_path = self._args.search_path
 		else:
-			search_path = os.path.dirname(self._args.inputfile)
-		if not search_path.endswith("/"):
-			search_path += "/"
+			search_path = os.path.dirname(self._filename)
+		return os.path.join(search_path, blob_data["filename"])
+
+	def read_range(self, blob_name, start, stop):
+		# Reads bytes [start, stop) of a blob. Uncompressed external files are
+		# read directly at that offset instead of loading the whole blob; the
+		# hash of such a partial read cannot be verified, only the file size.
+		blob_data = self._meta["data"][blob_name]
+		if (blob_name not in self._storage) and (blob_data["storage"] == "external"):
+			full_filename = self._external_filename(blob_data)
+			if os.path.isfile(full_filename) and (os.path.getsize(full_filename) == blob_data["length"]):
+				with open(full_filename, "rb") as f:
+					f.seek(start)
+					return f.read(max(stop - start, 0))
+		data = self.get_storage(blob_name)
+		if data is None:
+			return None
+		return data[start : stop]
 
-		full_filename = search_path + blob_data["filename"]
+	def _load_external_blob(self, blob_data, mapped = False):
+		full_filename = self._external_filename(blob_data)
 		if os.path.isfile(full_filename):
 			with open(full_filename, "rb") as f:
+				if mapped:
+					return self._map_file(f)
 				return f.read()
 
 		if os.path.isfile(full_filename + ".gz"):
 			with gzip.open(full_filename + ".gz") as f:
+				if mapped:
+					return self._map_chunks(self._iter_file_chunks(f, self._CHUNK_SIZE))
 				return f.read()
 
 		raise UnableToLoadStorageException("File not found: %s" % (full_filename))
 
 	def write_waveform(self, outputfile, out_format = "gnuplot"):
 		assert(out_format in [ "gnuplot", "png" ])
-		waveform_interpreter = RigolWaveformInterpreter(self._args, self)
+		if self._args.x_range is not None:
+			from WaveformPyramid import PyramidWaveformPlot
+			waveform_interpreter = PyramidWaveformPlot(self._args, self)
+		else:
+			waveform_interpreter = RigolWaveformInterpreter(self._args, self)
 		waveform_interpreter.write(outputfile, out_format)
 
+	def write_spectrum(self, outputfile, out_format = "png"):
+		from Spectrum import SpectrumPlot
+		SpectrumPlot(self._args, self).write(outputfile, out_format)
+
+	def write_export(self, outputfile, out_format = "csv"):
+		from WaveformExport import WaveformExporter
+		WaveformExporter(self._args, self).write(outputfile, out_format)
+
+	def write_measurements(self, outputfile, out_format = "json"):
+		# Imported here so that plain plotting does not depend on numpy
+		from WaveformMeasurement import MeasurementWriter
+		MeasurementWriter(self._args, self).write(outputfile, out_format)
+
 	def write_hardcopy(self, outputfile):
 		for (blob_name, blob_meta, data) in self.iter_hardcopy():
 			with open(outputfile, "wb") as f:
@@ -186,10 +342,17 @@ class InputFile(object):
 			print("Wrote hardcopy \"%s\" to %s." % (blob_name, outputfile), file = sys.stderr)
 			break
 
+	def iter_type_meta(self, typename):
+		# Like iter_type, but does not load any data
+		for (blob_name, blob_data) in self._sorted_blobs():
+			if blob_data["meta"]["type"] == typename:
+				yield (blob_name, blob_data)
+
 	def iter_type(self, typename):
-		for (blob_name, blob_meta, storage) in self:
-			if blob_meta["type"] == typename:
-				yield (blob_name, blob_meta, storage)
+		for (blob_name, blob_data) in self.iter_type_meta(typename):
+			storage = self.get_storage(blob_name)
+			if storage is not None:
+				yield (blob_name, blob_data["meta"], storage)
 
 	def iter_hardcopy(self):
 		return self.iter_type("hardcopy")
@@ -197,13 +360,21 @@ class InputFile(object):
 	def iter_waveform(self):
 		return self.iter_type("waveform")
 
+	@property
+	def filename(self):
+		return self._filename
+
 	def get(self, key):
 		return self._meta.get(key)
 
 	def __getitem__(self, key):
 		return self._meta[key]
 
+	def _sorted_blobs(self):
+		return sorted(self._meta["data"].items(), key = lambda v: (v[1].get("channel", 0), v[0]))
+
 	def __iter__(self):
-		for (blob_name, blob_data) in sorted(self._meta["data"].items(), key = lambda v: (v[1].get("channel", 0), v[0])):
-			if blob_name in self._storage:
-				yield (blob_name, blob_data["meta"], self._storage[blob_name])
+		for (blob_name, blob_data) in self._sorted_blobs():
+			storage = self.get_storage(blob_name)
+			if storage is not None:
+				yield (blob_name, blob_data["meta"], storage)
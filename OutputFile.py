@@ -20,12 +20,16 @@
 #	Johannes Bauer <JohannesBauer@gmx.de>
 
 import os
+import re
 import datetime
 import json
+import concurrent.futures
 from TMCDataTypes import TMCJSONEncoder
+from TransferCheckpoint import TransferCheckpoint
+from Profiler import Profiler
 
 class OutputFile(object):
-	def __init__(self, include_serial = True):
+	def __init__(self, include_serial = True, executor = None):
 		self._creation = datetime.datetime.utcnow()
 		self._comment = None
 		self._connection = None
@@ -34,6 +38,11 @@ class OutputFile(object):
 		self._instrument = None
 		self._raw_data = { }
 		self._include_serial = include_serial
+		self._executor = executor
+		self._target = None
+		self._pending = [ ]
+		self._checkpoints = [ ]
+		self._staged_files = { }
 
 	@property
 	def comment(self):
@@ -75,8 +84,51 @@ class OutputFile(object):
 	def instrument(self, value):
 		self._instrument = value
 
+	def add_checkpoint(self, checkpoint_filename):
+		# Transfer checkpoints are only removed once the output was written
+		self._checkpoints.append(checkpoint_filename)
+
+	def prepare(self, file_format, filename):
+		# When the output target is known in advance and an executor is
+		# present, raw data is hashed, compressed and written as soon as it is
+		# added, while the next chunk of data is still being transferred.
+		if file_format not in [ "json", "files" ]:
+			raise Exception("Unsupported file format: %s" % (file_format))
+		self._target = (file_format, filename)
+
 	def add_raw_data(self, name, raw_data):
 		self._raw_data[name] = raw_data
+		if (self._executor is not None) and (self._target is not None):
+			self._pending.append(self._executor.submit(self._process_raw_data, name, raw_data, *self._target))
+
+	@staticmethod
+	def _raw_filename(filename, name, raw_data):
+		return filename + "_%s.%s" % (name, raw_data.file_format)
+
+	def _process_raw_data(self, name, raw_data, file_format, filename):
+		with Profiler.stage("encode %s" % (name)):
+			self._encode_raw_data(name, raw_data, file_format, filename)
+		return name
+
+	def _encode_raw_data(self, name, raw_data, file_format, filename):
+		if file_format == "json":
+			raw_data.to_repr()
+		elif file_format == "files":
+			# Written under a temporary name and only renamed into place when
+			# the output is written, so an aborted capture leaves no files.
+			raw_filename = self._raw_filename(filename, name, raw_data)
+			raw_data.write_file(raw_filename + ".tmp")
+			self._staged_files[name] = raw_filename + ".tmp"
+			raw_data.to_repr(external_filename = os.path.basename(raw_filename))
+
+	def _finish_pending(self, file_format, filename):
+		# Returns the names of all raw data that was completely processed in
+		# the background for this very output target.
+		processed = set(future.result() for future in self._pending)
+		self._pending = [ ]
+		if self._target != (file_format, filename):
+			return set()
+		return processed
 
 	def _metadata(self):
 		content = {
@@ -103,26 +155,66 @@ class OutputFile(object):
 		return content
 
 	def _write_json(self, filename):
+		self._finish_pending("json", filename)
 		content = self._metadata()
 		content["data"] = self._raw_data
+		text = json.dumps(content, sort_keys = True, indent = 4, cls = TMCJSONEncoder)
+		# Spooled raw data is represented by a placeholder which is replaced
+		# by streaming its compressed data into the file.
+		spooled = { raw_data.placeholder: raw_data for raw_data in self._raw_data.values() if raw_data.placeholder is not None }
 		with open(filename, "w") as f:
-			print(json.dumps(content, sort_keys = True, indent = 4, cls = TMCJSONEncoder), file = f)
+			if len(spooled) == 0:
+				print(text, file = f)
+			else:
+				for piece in re.split("(%s)" % ("|".join(re.escape(placeholder) for placeholder in spooled)), text):
+					if piece in spooled:
+						spooled[piece].write_inline_data(f)
+					else:
+						f.write(piece)
+				print(file = f)
 
 	def _write_files(self, filename):
+		processed = self._finish_pending("files", filename)
 		content = self._metadata()
 		content["data"] = { }
 		for (name, raw_data) in self._raw_data.items():
-			raw_filename = filename + "_%s.%s" % (name, raw_data.file_format)
+			raw_filename = self._raw_filename(filename, name, raw_data)
+			if name in processed:
+				raw_data.rename_file(self._staged_files.pop(name), raw_filename)
+			else:
+				raw_data.write_file(raw_filename)
 			content["data"][name] = raw_data.to_repr(external_filename = os.path.basename(raw_filename))
-			with open(raw_filename, "wb") as f:
-				f.write(raw_data.data)
 		with open(filename + "_meta.json", "w") as f:
 			print(json.dumps(content, sort_keys = True, indent = 4, cls = TMCJSONEncoder), file = f)
 
 	def write(self, file_format, filename):
-		if file_format == "json":
-			return self._write_json(filename)
-		elif file_format == "files":
-			return self._write_files(filename)
-		else:
-			raise Exception("Unsupported file format: %s" % (file_format))
+		with Profiler.stage("write %s" % (file_format)):
+			if file_format == "json":
+				self._write_json(filename)
+			elif file_format == "files":
+				self._write_files(filename)
+			else:
+				raise Exception("Unsupported file format: %s" % (file_format))
+		for checkpoint_filename in self._checkpoints:
+			TransferCheckpoint.remove(checkpoint_filename)
+		self._checkpoints = [ ]
+
+	def write_pyramid(self, file_format, filename):
+		# Stores the min/max pyramid used for zooming next to the capture;
+		# imported here so that capturing does not depend on numpy otherwise.
+		from WaveformPyramid import WaveformPyramid
+		capture_filename = filename if (file_format == "json") else filename + "_meta.json"
+		with Profiler.stage("write pyramid"):
+			blobs = ((name, raw_data.sha256, raw_data.data) for (name, raw_data) in sorted(self._raw_data.items()) if raw_data.metadata["type"] == "waveform")
+			WaveformPyramid.build(capture_filename, blobs)
+
+	def close(self):
+		# Removes spooled raw data and files written in the background that
+		# have not become part of the output
+		concurrent.futures.wait(self._pending)
+		for staged_filename in self._staged_files.values():
+			if os.path.exists(staged_filename):
+				os.unlink(staged_filename)
+		self._staged_files = { }
+		for raw_data in self._raw_data.values():
+			raw_data.discard()
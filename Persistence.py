@@ -0,0 +1,189 @@
+#	rigolrdout - Read data and screenshots from Rigol oscilloscopes
+#	Copyright (C) 2012-2018 Johannes Bauer
+#
+#	This file is part of rigolrdout.
+#
+#	rigolrdout is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; this program is ONLY licensed under
+#	version 3 of the License, later versions are explicitly excluded.
+#
+#	rigolrdout is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with rigolrdout; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#	Johannes Bauer <JohannesBauer@gmx.de>
+
+import math
+import multiprocessing
+import numpy
+from GnuplotRenderer import GnuplotRenderer
+from InputFile import InputFile
+from WaveformData import WaveformData
+
+class PersistenceHistogram(object):
+	# 2D hit histogram with a fixed time-by-voltage resolution. Memory only
+	# depends on that resolution, never on the number or depth of captures.
+	def __init__(self, width, height, x_range, y_range, eye_period = None, channel = None):
+		self._width = width
+		self._height = height
+		self._x_range = x_range
+		self._y_range = y_range
+		self._eye_period = eye_period
+		self._channel = channel
+		self._hits = numpy.zeros(width * height, dtype = numpy.int64)
+
+	@property
+	def hits(self):
+		return self._hits.reshape((self._height, self._width))
+
+	@property
+	def x_range(self):
+		return self._x_range
+
+	@property
+	def y_range(self):
+		return self._y_range
+
+	def _y_bin_lookup(self, waveform):
+		# Every possible 8-bit code maps to exactly one voltage bin (or none,
+		# if it is outside of the plotted range).
+		volts = waveform.to_volts(numpy.arange(256))
+		ybins = numpy.floor((volts - self._y_range[0]) / (self._y_range[1] - self._y_range[0]) * self._height).astype(numpy.int64)
+		ybins[(ybins < 0) | (ybins >= self._height)] = -1
+		return ybins
+
+	def add_waveform(self, waveform):
+		ybin_lookup = self._y_bin_lookup(waveform)
+		(x_min, x_max) = self._x_range
+		for (offset, chunk) in waveform.iter_chunks():
+			times = waveform.to_seconds(numpy.arange(offset, offset + len(chunk)))
+			if self._eye_period is not None:
+				times = numpy.mod(times, self._eye_period)
+			xbins = numpy.floor((times - x_min) / (x_max - x_min) * self._width).astype(numpy.int64)
+			ybins = ybin_lookup[chunk]
+			valid = (xbins >= 0) & (xbins < self._width) & (ybins >= 0)
+			self._hits += numpy.bincount(ybins[valid] * self._width + xbins[valid], minlength = len(self._hits))
+
+	def add_input(self, inputfile):
+		for waveform in WaveformData.iter_input(inputfile):
+			if (self._channel is None) or (waveform.channel == self._channel):
+				self.add_waveform(waveform)
+
+	def merge(self, other):
+		self._hits += other._hits
+
+	@classmethod
+	def capture_ranges(cls, task):
+		# Entry point of the worker processes: Time and voltage range of
+		# every matching waveform and the title metadata of every capture.
+		# Only the metadata is read, inline data is skipped without parsing
+		# it. Only the conversions of WaveformData are used.
+		(args, filenames, channel) = task
+		captures = [ ]
+		for filename in filenames:
+			inputfile = InputFile(args, filename, metadata_only = True)
+			ranges = [ ]
+			for (name, blob_data) in inputfile.iter_type_meta("waveform"):
+				if (channel is None) or (blob_data["meta"]["channel"] == channel):
+					waveform = WaveformData(inputfile, name, blob_data["meta"], b"")
+					x_range = (float(waveform.to_seconds(0)), float(waveform.to_seconds(blob_data["length"])))
+					y_range = (float(waveform.to_volts(0)), float(waveform.to_volts(255)))
+					ranges.append((x_range, y_range))
+			title = { key: inputfile[key] for key in [ "comment", "instrument" ] if inputfile.get(key) is not None }
+			captures.append((filename, title, ranges))
+		return captures
+
+	@classmethod
+	def accumulate_files(cls, task):
+		# Entry point of the worker processes
+		(args, filenames, histogram_args) = task
+		histogram = cls(**histogram_args)
+		for filename in filenames:
+			histogram.add_input(InputFile(args, filename))
+		return histogram
+
+class PersistencePlot(GnuplotRenderer):
+	# Every worker gets several tasks, so that captures of different depth
+	# still spread evenly.
+	_TASKS_PER_JOB = 4
+
+	def __init__(self, args, filenames):
+		self._filenames = filenames
+		# The title is taken from the first capture once its metadata has
+		# been read
+		GnuplotRenderer.__init__(self, args, None)
+
+	def _histogram_args(self, ranges):
+		# The plot covers all matching waveforms of all captures: Their whole
+		# records (or one eye period) horizontally and their full 8-bit code
+		# ranges vertically.
+		if len(ranges) == 0:
+			raise Exception("No capture contains a matching waveform.")
+		if self._args.eye_period is not None:
+			x_range = (0, self._args.eye_period)
+		else:
+			x_range = (min(x_range[0] for (x_range, y_range) in ranges), max(x_range[1] for (x_range, y_range) in ranges))
+		y_range = (min(y_range[0] for (x_range, y_range) in ranges), max(y_range[1] for (x_range, y_range) in ranges))
+		return {
+			"width":		self._args.width,
+			"height":		self._args.height,
+			"x_range":		x_range,
+			"y_range":		y_range,
+			"eye_period":	self._args.eye_period,
+			"channel":		self._args.channel,
+		}
+
+	def _accumulate(self, chunks, map_function):
+		ranges = [ ]
+		for captures in map_function(PersistenceHistogram.capture_ranges, [ (self._args, chunk, self._args.channel) for chunk in chunks ]):
+			for (filename, title, capture_ranges) in captures:
+				if filename == self._filenames[0]:
+					self._input = title
+				ranges += capture_ranges
+		histogram_args = self._histogram_args(ranges)
+		histogram = PersistenceHistogram(**histogram_args)
+		for partial_histogram in map_function(PersistenceHistogram.accumulate_files, [ (self._args, chunk, histogram_args) for chunk in chunks ]):
+			histogram.merge(partial_histogram)
+		return histogram
+
+	def accumulate(self):
+		jobs = min(self._args.jobs, len(self._filenames))
+		files_per_task = math.ceil(len(self._filenames) / (jobs * self._TASKS_PER_JOB))
+		chunks = [ self._filenames[i : i + files_per_task] for i in range(0, len(self._filenames), files_per_task) ]
+		if jobs == 1:
+			return self._accumulate(chunks, map)
+		# Forked explicitly: rigolplot is a script without a main guard, which
+		# the spawn and forkserver start methods would run again in every
+		# worker.
+		with multiprocessing.get_context("fork").Pool(processes = jobs) as pool:
+			return self._accumulate(chunks, pool.imap_unordered)
+
+	def write_gpl(self, f):
+		histogram = self.accumulate()
+		(xunit, xunit_value) = self._get_unit(self._args.x_unit)
+		(yunit, yunit_value) = self._get_unit(self._args.y_unit)
+		(x_min, x_max) = (value / xunit_value for value in histogram.x_range)
+		(y_min, y_max) = (value / yunit_value for value in histogram.y_range)
+		(dx, dy) = ((x_max - x_min) / self._args.width, (y_max - y_min) / self._args.height)
+
+		print("# persistence of %d capture(s)" % (len(self._filenames)), file = f)
+		self._write_gpl_header(f)
+		print("set xlabel \"x / %ss\"" % (xunit), file = f)
+		print("set ylabel \"y / %sV\"" % (yunit), file = f)
+		print("set xrange [%e:%e]" % (x_min, x_max), file = f)
+		print("set yrange [%e:%e]" % (y_min, y_max), file = f)
+		print("set cblabel \"log10(1 + hits)\"", file = f)
+		print("set palette defined (0 \"black\", 1 \"#000080\", 2 \"#00c0ff\", 3 \"#40ff40\", 4 \"#ffff00\", 5 \"#ff4000\", 6 \"white\")", file = f)
+		print("unset key", file = f)
+		print("plot '-' matrix using (%e + ($1 + 0.5) * %e):(%e + ($2 + 0.5) * %e):3 with image" % (x_min, dx, y_min, dy), file = f)
+		# Logarithmic intensity grading, rare events would be invisible
+		# otherwise.
+		numpy.savetxt(f, numpy.log10(1 + histogram.hits), fmt = "%.3f")
+		print("e", file = f)
+		print("e", file = f)
@@ -0,0 +1,97 @@
+#	rigolrdout - Read data and screenshots from Rigol oscilloscopes
+#	Copyright (C) 2012-2018 Johannes Bauer
+#
+#	This file is part of rigolrdout.
+#
+#	rigolrdout is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; this program is ONLY licensed under
+#	version 3 of the License, later versions are explicitly excluded.
+#
+#	rigolrdout is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with rigolrdout; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#	Johannes Bauer <JohannesBauer@gmx.de>
+
+import sys
+import time
+import json
+import resource
+import threading
+import contextlib
+import cProfile
+from StopWatch import StopWatch
+
+class Profiler(object):
+	# Process-wide collection of per-stage timings. Disabled unless enabled
+	# by the command line tool, in which case stage() is nearly free.
+	_enabled = False
+	_stages = [ ]
+	_lock = threading.Lock()
+	_start = None
+	_cprofile = None
+
+	@classmethod
+	def enable(cls, with_cprofile = False):
+		cls._enabled = True
+		cls._start = time.time()
+		if with_cprofile:
+			cls._cprofile = cProfile.Profile()
+			cls._cprofile.enable()
+
+	@staticmethod
+	def _rss_high_water_kib(who = resource.RUSAGE_SELF):
+		# ru_maxrss is the high water mark of the whole process (all of its
+		# threads). How much a stage raised it is recorded as well; stages
+		# that run concurrently in different threads share that growth. For
+		# RUSAGE_CHILDREN, it is the one of the largest finished worker
+		# process.
+		return resource.getrusage(who).ru_maxrss
+
+	@classmethod
+	@contextlib.contextmanager
+	def stage(cls, name):
+		if not cls._enabled:
+			yield
+			return
+		start = time.time()
+		rss_high_water_start = cls._rss_high_water_kib()
+		stopwatch = StopWatch(name)
+		try:
+			yield
+		finally:
+			stopwatch.finish()
+			rss_high_water = cls._rss_high_water_kib()
+			with cls._lock:
+				cls._stages.append({
+					"name":							name,
+					"start":						start - cls._start,
+					"duration":						stopwatch.finishtime,
+					"thread":						threading.current_thread().name,
+					"rss_high_water_kib":			rss_high_water,
+					"rss_high_water_growth_kib":	rss_high_water - rss_high_water_start,
+				})
+
+	@classmethod
+	def write(cls, json_filename = None, cprofile_filename = None):
+		if cls._cprofile is not None:
+			cls._cprofile.disable()
+			if cprofile_filename is not None:
+				cls._cprofile.dump_stats(cprofile_filename)
+		if json_filename is not None:
+			with cls._lock:
+				result = {
+					"command":						sys.argv,
+					"total":						time.time() - cls._start,
+					"rss_high_water_kib":			cls._rss_high_water_kib(),
+					"worker_rss_high_water_kib":	cls._rss_high_water_kib(resource.RUSAGE_CHILDREN),
+					"stages":						list(cls._stages),
+				}
+			with open(json_filename, "w") as f:
+				print(json.dumps(result, indent = 4), file = f)
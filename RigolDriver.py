@@ -19,9 +19,14 @@
 #
 #	Johannes Bauer <JohannesBauer@gmx.de>
 
+import sys
 import time
+import hashlib
 import collections
-from TMCDataTypes import TMCBool, TMCFloat, TMCRawData
+from TMCDataTypes import TMCBool, TMCFloat, TMCRawData, TMCSpooledRawData
+from DataBuffer import DataBufferTimeout
+from Connections import ProtocolException
+from TransferCheckpoint import TransferCheckpoint
 
 class RigolDriver(object):
 	_InstrumentParameters = collections.namedtuple("InstrumentParameters", [ "number_channels" ])
@@ -56,8 +61,11 @@ class RigolDriver(object):
 	def stop(self):
 		response = self._conn.command(":STOP")
 
+	def single(self):
+		response = self._conn.command(":SING")
+
 	def get_acquisition_info(self):
-		result = {
+		return {
 			"acquisition": {
 				"type":			self._conn.command(":ACQ:TYPE?"),
 				"sample_rate":	TMCFloat(self._conn.command(":ACQ:SRAT?")),
@@ -69,25 +77,42 @@ class RigolDriver(object):
 				"scale":		TMCFloat(self._conn.command(":TIM:SCAL?")),
 				"mode":			self._conn.command(":TIM:MODE?"),
 			},
-			"trigger": {
-				"mode":			self._conn.command(":TRIG:MODE?"),
-				"coupling":		self._conn.command(":TRIG:COUP?"),
-				"status":		self._conn.command(":TRIG:STAT?"),
-				"sweep":		self._conn.command(":TRIG:SWE?"),
-				"holdoff":		TMCFloat(self._conn.command(":TRIG:HOLD?")),
-				"nreject":		TMCBool(self._conn.command(":TRIG:NREJ?")),
-				"position":		int(self._conn.command(":TRIG:POS?")),
-				"specific":		None,
-			},
+			"trigger":			self.get_trigger_info(),
+		}
+
+	def get_trigger_info(self):
+		result = {
+			"mode":			self._conn.command(":TRIG:MODE?"),
+			"coupling":		self._conn.command(":TRIG:COUP?"),
+			"sweep":		self._conn.command(":TRIG:SWE?"),
+			"holdoff":		TMCFloat(self._conn.command(":TRIG:HOLD?")),
+			"nreject":		TMCBool(self._conn.command(":TRIG:NREJ?")),
+			"specific":		None,
 		}
-		if result["trigger"]["mode"].lower() == "edge":
-			result["trigger"]["specific"] = {
+		result.update(self.get_trigger_state())
+		if result["mode"].lower() == "edge":
+			result["specific"] = {
 				"source":	self._conn.command(":TRIG:EDG:SOUR?"),
 				"slope":	self._conn.command(":TRIG:EDG:SLOP?"),
 				"level":	TMCFloat(self._conn.command(":TRIG:EDG:LEV?")),
 			}
 		return result
 
+	def get_trigger_state(self):
+		# Changes with every acquisition, unlike the rest of the settings.
+		return {
+			"status":		self._conn.command(":TRIG:STAT?"),
+			"position":		int(self._conn.command(":TRIG:POS?")),
+		}
+
+	def get_settings_probe(self):
+		# Hash of the complete setup of the instrument, the same binary block
+		# that :SYST:SET restores. A single query that changes whenever any
+		# setting does, including the trigger settings (which are always read
+		# completely anyway), but not with every acquisition.
+		self._conn.command(":SYST:SET?", wait_response = False)
+		return hashlib.sha256(self._conn.get_tmc_data(timeout = 5.0)).hexdigest()
+
 	def get_channel_info(self, channel_id):
 		return {
 			"bw_limit":	self._conn.command(":CHAN%d:BWL?" % (channel_id)),
@@ -102,12 +127,33 @@ class RigolDriver(object):
 			"vernier":	TMCBool(self._conn.command(":CHAN%d:VERN?" % (channel_id))),
 		}
 
-	def get_waveform(self, channel_id):
+	def _get_waveform_window(self, start, stop, retries):
+		for attempt in range(retries + 1):
+			try:
+				self._conn.command(":WAV:STAR %d" % (start))
+				self._conn.command(":WAV:STOP %d" % (stop))
+				self._conn.command(":WAV:DATA?", wait_response = False)
+				data = self._conn.get_tmc_data(timeout = 5.0)
+				if len(data) != stop - start + 1:
+					raise ProtocolException("Requested %d bytes, but received %d." % (stop - start + 1, len(data)))
+				return data
+			except (DataBufferTimeout, ProtocolException) as e:
+				if attempt == retries:
+					raise
+				# Get rid of the remainder of the failed response before
+				# asking for the same window again.
+				discarded = self._conn.drain()
+				print("Transfer of samples %d-%d failed (%s), discarded %d stale bytes, retry %d of %d." % (start, stop, str(e), discarded, attempt + 1, retries), file = sys.stderr)
+
+	def get_waveform(self, channel_id, retries = 3, checkpoint_filename = None, spool_filename = None, max_in_memory = None):
+		# Records of more than max_in_memory points are collected in
+		# spool_filename instead of memory. The checkpoint is kept, the caller
+		# removes it once the capture has been written.
 		self._conn.command(":WAV:SOUR CHAN%d" % (channel_id))
 		self._conn.command(":WAV:MODE RAW")
 		self._conn.command(":WAV:FORM BYTE")
-		preamble = self._conn.command(":WAV:PRE?")
-		preamble = preamble.split(",")
+		raw_preamble = self._conn.command(":WAV:PRE?")
+		preamble = raw_preamble.split(",")
 		assert(len(preamble) == 10)
 
 		metadata = {
@@ -133,21 +179,59 @@ class RigolDriver(object):
 			"y_reference":	int(preamble[9]),
 		}
 
-		raw_data = bytearray()
 		total_bytes = metadata["points"]
 		bytes_per_batch = 250000
 		batches = (total_bytes + bytes_per_batch - 1) // bytes_per_batch
-		for i in range(batches):
-			start = 1 + (i * bytes_per_batch)
-			stop = start + bytes_per_batch - 1
-			stop = min(stop, total_bytes)
-			self._conn.command(":WAV:STAR %d" % (start))
-			self._conn.command(":WAV:STOP %d" % (stop))
-			self._conn.command(":WAV:DATA?", wait_response = False)
-			data = self._conn.get_tmc_data(timeout = 5.0)
-			raw_data += data
-			time.sleep(0.1)
-
+		if (spool_filename is not None) and (max_in_memory is not None) and (total_bytes > max_in_memory):
+			raw_data = TMCSpooledRawData(spool_filename, file_format = "bin", metadata = metadata)
+		else:
+			raw_data = bytearray()
+		try:
+			if checkpoint_filename is not None:
+				identity = {
+					"preamble":			raw_preamble,
+					"trigger_position":	self._conn.command(":TRIG:POS?"),
+					"timebase_scale":	self._conn.command(":TIM:SCAL?"),
+					"timebase_offset":	self._conn.command(":TIM:OFFS?"),
+				}
+				checkpoint = TransferCheckpoint(checkpoint_filename, identity, bytes_per_batch)
+				resumed = checkpoint.resumable_length(total_bytes)
+				if resumed > 0:
+					# A new acquisition with the same settings and trigger position
+					# has the same identity, but (almost certainly) not the same
+					# samples. The last saved window is therefore transferred again
+					# and compared.
+					start = 1 + ((resumed - 1) // bytes_per_batch) * bytes_per_batch
+					if self._get_waveform_window(start, resumed, retries) != checkpoint.read(start - 1, resumed - start + 1):
+						print("Saved transfer of channel %d belongs to a different acquisition, discarding it." % (channel_id), file = sys.stderr)
+						resumed = 0
+				if resumed > 0:
+					checkpoint.load(raw_data, resumed)
+					print("Resuming transfer of channel %d after %d of %d bytes." % (channel_id, resumed, total_bytes), file = sys.stderr)
+				checkpoint.start(resumed)
+			else:
+				checkpoint = None
+
+			# Resumed data is made up of complete windows, so the transfer
+			# continues with the first window that is missing.
+			for i in range((len(raw_data) + bytes_per_batch - 1) // bytes_per_batch, batches):
+				start = 1 + (i * bytes_per_batch)
+				stop = start + bytes_per_batch - 1
+				stop = min(stop, total_bytes)
+				data = self._get_waveform_window(start, stop, retries)
+				raw_data.extend(data)
+				if checkpoint is not None:
+					checkpoint.append(data)
+				time.sleep(0.1)
+		except:
+			if isinstance(raw_data, TMCSpooledRawData):
+				raw_data.close()
+				raw_data.discard()
+			raise
+
+		if isinstance(raw_data, TMCSpooledRawData):
+			raw_data.close()
+			return raw_data
 		return TMCRawData(data = raw_data, file_format = "bin", metadata = metadata)
 
 	def is_channel_enabled(self, channel_id):
@@ -0,0 +1,88 @@
+#	rigolrdout - Read data and screenshots from Rigol oscilloscopes
+#	Copyright (C) 2012-2018 Johannes Bauer
+#
+#	This file is part of rigolrdout.
+#
+#	rigolrdout is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; this program is ONLY licensed under
+#	version 3 of the License, later versions are explicitly excluded.
+#
+#	rigolrdout is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with rigolrdout; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#	Johannes Bauer <JohannesBauer@gmx.de>
+
+import os
+import copy
+import json
+import tempfile
+import threading
+from TMCDataTypes import TMCJSONEncoder
+
+class SettingsCache(object):
+	# Caches channel and acquisition settings per instrument serial number in
+	# a JSON file. The cached values are stored in exactly the representation
+	# that OutputFile writes, so output does not depend on whether they came
+	# from the cache or not. Trigger settings are never cached.
+
+	def __init__(self, filename):
+		self._filename = filename
+		self._lock = threading.Lock()
+		self._entries = self._load()
+
+	def _load(self):
+		try:
+			with open(self._filename) as f:
+				return json.load(f)
+		except (FileNotFoundError, json.JSONDecodeError):
+			return { }
+
+	def _save(self):
+		directory = os.path.dirname(self._filename)
+		if directory != "":
+			os.makedirs(directory, exist_ok = True)
+		# Unique temporary name, several processes may share one cache file
+		with tempfile.NamedTemporaryFile(mode = "w", dir = directory if (directory != "") else ".", prefix = os.path.basename(self._filename) + ".", suffix = ".tmp", delete = False) as f:
+			json.dump(self._entries, f, sort_keys = True, indent = 4)
+		os.replace(f.name, self._filename)
+
+	@staticmethod
+	def _to_repr(value):
+		return json.loads(json.dumps(value, cls = TMCJSONEncoder))
+
+	@staticmethod
+	def _from_entry(entry, trigger_info):
+		channel_info = { int(channel_id): info for (channel_id, info) in entry["channel_info"].items() }
+		acquisition_info = copy.deepcopy(entry["acquisition_info"])
+		acquisition_info["trigger"] = trigger_info
+		return (channel_info, acquisition_info)
+
+	def get_settings(self, oscilloscope, refresh = False):
+		# Returns (channel_info, acquisition_info), only doing a full re-read
+		# of the settings when the probe shows a change.
+		serial = oscilloscope.identification.serial
+		probe = oscilloscope.get_settings_probe()
+		with self._lock:
+			entry = self._entries.get(serial)
+		if (not refresh) and (entry is not None) and (entry["probe"] == probe):
+			return self._from_entry(entry, oscilloscope.get_trigger_info())
+
+		channel_info = oscilloscope.get_enabled_channel_info()
+		acquisition_info = oscilloscope.get_acquisition_info()
+		entry = {
+			"probe":			probe,
+			"channel_info":		self._to_repr(channel_info),
+			"acquisition_info":	self._to_repr(acquisition_info),
+		}
+		del entry["acquisition_info"]["trigger"]
+		with self._lock:
+			self._entries[serial] = entry
+			self._save()
+		return (channel_info, acquisition_info)
@@ -0,0 +1,116 @@
+#	rigolrdout - Read data and screenshots from Rigol oscilloscopes
+#	Copyright (C) 2012-2018 Johannes Bauer
+#
+#	This file is part of rigolrdout.
+#
+#	rigolrdout is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; this program is ONLY licensed under
+#	version 3 of the License, later versions are explicitly excluded.
+#
+#	rigolrdout is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with rigolrdout; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#	Johannes Bauer <JohannesBauer@gmx.de>
+
+import sys
+import numpy
+from GnuplotRenderer import GnuplotRenderer
+from WaveformData import WaveformData
+
+class SpectrumException(Exception): pass
+
+class WelchSpectrum(object):
+	_WINDOWS = {
+		"rect":		lambda n: numpy.ones(n),
+		"hann":		numpy.hanning,
+		"hamming":	numpy.hamming,
+		"blackman":	numpy.blackman,
+	}
+
+	# Number of samples that are converted to floating point at once. Bounds
+	# the working memory independently of the record length.
+	_SAMPLES_PER_BATCH = 1024 * 1024
+	_MIN_FFT_SIZE = 4
+
+	def __init__(self, waveform, fft_size, window = "hann"):
+		# Records shorter than the FFT size use a single block of the largest
+		# power of two that fits.
+		if waveform.points < self._MIN_FFT_SIZE:
+			raise SpectrumException("Waveform %s has only %d samples, at least %d are needed for a spectrum." % (waveform.name, waveform.points, self._MIN_FFT_SIZE))
+		self._waveform = waveform
+		self._fft_size = min(fft_size, 1 << (waveform.points.bit_length() - 1))
+		self._window = self._WINDOWS[window](self._fft_size)
+
+	@property
+	def fft_size(self):
+		return self._fft_size
+
+	def compute(self):
+		# Welch's method: Blocks overlap by 50%, each one has its mean removed
+		# and is windowed; the one-sided power spectral densities are
+		# averaged. Returns (frequencies in Hz, PSD in V^2/Hz, block count).
+		step = self._fft_size // 2
+		blocks = numpy.lib.stride_tricks.sliding_window_view(self._waveform.raw, self._fft_size)[::step]
+		batch_size = max(1, self._SAMPLES_PER_BATCH // self._fft_size)
+
+		psd_sum = numpy.zeros(self._fft_size // 2 + 1)
+		for batch_start in range(0, len(blocks), batch_size):
+			batch = blocks[batch_start : batch_start + batch_size].astype(numpy.float64)
+			batch -= batch.mean(axis = 1, keepdims = True)
+			batch *= self._window
+			psd_sum += (numpy.abs(numpy.fft.rfft(batch, axis = 1)) ** 2).sum(axis = 0)
+
+		sample_rate = 1 / self._waveform.x_increment
+		scale = (self._waveform.y_increment ** 2) / (sample_rate * (self._window ** 2).sum() * len(blocks))
+		psd = psd_sum * scale
+		# One-sided spectrum: Fold the energy of negative frequencies over,
+		# except for DC and (for even sizes) Nyquist.
+		psd[1:-1] *= 2
+		if self._fft_size % 2 == 1:
+			psd[-1] *= 2
+		frequencies = numpy.fft.rfftfreq(self._fft_size, d = self._waveform.x_increment)
+		return (frequencies, psd, len(blocks))
+
+class SpectrumPlot(GnuplotRenderer):
+	def __init__(self, args, inputfile):
+		GnuplotRenderer.__init__(self, args, inputfile)
+		self._waveforms = list(WaveformData.iter_input(self._input))
+
+	def write_gpl(self, f):
+		spectra = [ ]
+		for waveform in self._waveforms:
+			try:
+				spectrum = WelchSpectrum(waveform, fft_size = self._args.fft_size, window = self._args.fft_window)
+			except SpectrumException as e:
+				print("%s -- ignoring this waveform." % (str(e)), file = sys.stderr)
+				continue
+			spectra.append((waveform, spectrum.fft_size, spectrum.compute()))
+		if len(spectra) == 0:
+			raise SpectrumException("No waveform has enough samples for a spectrum.")
+
+		print("# %d spectrum/spectra" % (len(spectra)), file = f)
+		self._write_gpl_header(f)
+		print("set xlabel \"f / Hz\"", file = f)
+		print("set ylabel \"PSD / dB(V²/Hz)\"", file = f)
+		print("set format x \"%.0s%c\"", file = f)
+		print("set ytics nomirror", file = f)
+		print("set grid", file = f)
+		plotcmds = [ ]
+		for (waveform, fft_size, (frequencies, psd, block_count)) in spectra:
+			plotcmds.append("'-' using 1:2 with lines title \"Channel %d (%d x %d pts %s)\" lc \"#%s\" lw 1" % (waveform.channel, block_count, fft_size, self._args.fft_window, self._waveform_color(waveform.channel)))
+		print("plot %s" % (", ".join(plotcmds)), file = f)
+		print(file = f)
+		for (waveform, fft_size, (frequencies, psd, block_count)) in spectra:
+			# Floor avoids log10(0) for bins that carry no energy at all.
+			psd_db = 10 * numpy.log10(numpy.maximum(psd, 1e-30))
+			for (frequency, value) in zip(frequencies.tolist(), psd_db.tolist()):
+				print("%.6e %.4f" % (frequency, value), file = f)
+			print("end", file = f)
+			print(file = f)
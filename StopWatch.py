@@ -67,6 +67,7 @@ class StopWatch(object):
 
 	def __enter__(self):
 		self.reset()
+		return self
 
 	def __exit__(self, type, value, traceback):
 		self.finish()
@@ -19,10 +19,14 @@
 #
 #	Johannes Bauer <JohannesBauer@gmx.de>
 
+import os
 import json
 import base64
 import hashlib
 import gzip
+import zlib
+import mmap
+import shutil
 
 class TMCBool(object):
 	_FALSE_VALUES = set([ "0", "off" ])
@@ -61,14 +65,22 @@ class TMCFloat(object):
 
 class TMCRawData(object):
 	def __init__(self, data, file_format, metadata = None):
-		self._data = bytes(data)
+		# A bytearray that was assembled by the caller is taken over as-is
+		# instead of being copied.
+		self._data = data if isinstance(data, (bytes, bytearray)) else bytes(data)
 		self._file_format = file_format
 		self._metadata = metadata
+		self._repr_cache = { }
+		self._sha256 = None
 
 	@property
 	def data(self):
 		return self._data
 
+	@property
+	def length(self):
+		return len(self._data)
+
 	@property
 	def file_format(self):
 		return self._file_format
@@ -77,14 +89,45 @@ class TMCRawData(object):
 	def metadata(self):
 		return self._metadata
 
+	@property
+	def placeholder(self):
+		# Only spooled data is not contained in its JSON representation
+		return None
+
+	def write_file(self, filename):
+		with open(filename, "wb") as f:
+			f.write(self._data)
+
+	def rename_file(self, old_filename, new_filename):
+		os.replace(old_filename, new_filename)
+
+	def discard(self):
+		pass
+
+	@property
+	def sha256(self):
+		if self._sha256 is None:
+			self._sha256 = hashlib.sha256(self._data).hexdigest()
+		return self._sha256
+
+	def _inline_data(self):
+		return base64.b64encode(gzip.compress(self._data)).decode("ascii")
+
 	def to_repr(self, external_filename = None):
+		# Hashing and compressing is expensive; the result is kept so that it
+		# can be computed ahead of time in a background thread.
+		if external_filename not in self._repr_cache:
+			self._repr_cache[external_filename] = self._compute_repr(external_filename)
+		return self._repr_cache[external_filename]
+
+	def _compute_repr(self, external_filename):
 		result = {
-			"length":	len(self._data),
+			"length":	self.length,
 			"format":	self._file_format,
-			"sha256":	hashlib.sha256(self._data).hexdigest(),
+			"sha256":	self.sha256,
 		}
 		if external_filename is None:
-			result["gzip_compressed_data"] = base64.b64encode(gzip.compress(self._data)).decode("ascii")
+			result["gzip_compressed_data"] = self._inline_data()
 			result["storage"] = "inline"
 		else:
 			result["filename"] = external_filename
@@ -93,6 +136,91 @@ class TMCRawData(object):
 			result["meta"] = self._metadata
 		return result
 
+class TMCSpooledRawData(TMCRawData):
+	# Raw data that is collected in a file instead of memory, for records that
+	# would exceed the memory budget. It is hashed while being appended to and
+	# only ever compressed in chunks. Appending works like for a bytearray.
+	_CHUNK_SIZE = 1024 * 1024
+
+	def __init__(self, spool_filename, file_format, metadata = None):
+		self._spool_filename = spool_filename
+		self._file_format = file_format
+		self._metadata = metadata
+		self._repr_cache = { }
+		self._length = 0
+		self._hash = hashlib.sha256()
+		self._f = open(spool_filename, "wb")
+		self._moved = False
+
+	def extend(self, data):
+		self._f.write(data)
+		self._hash.update(data)
+		self._length += len(data)
+
+	def __len__(self):
+		return self._length
+
+	def close(self):
+		self._f.close()
+
+	@property
+	def data(self):
+		if self._length == 0:
+			return b""
+		with open(self._spool_filename, "rb") as f:
+			return memoryview(mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ))
+
+	@property
+	def length(self):
+		return self._length
+
+	@property
+	def placeholder(self):
+		return "@spooled:%s@" % (os.path.basename(self._spool_filename))
+
+	def write_file(self, filename):
+		# The first write takes over the spool file, so that no copy is made
+		if self._moved:
+			shutil.copyfile(self._spool_filename, filename)
+		else:
+			shutil.move(self._spool_filename, filename)
+			self._spool_filename = filename
+			self._moved = True
+
+	def rename_file(self, old_filename, new_filename):
+		os.replace(old_filename, new_filename)
+		if self._spool_filename == old_filename:
+			self._spool_filename = new_filename
+
+	def write_inline_data(self, f):
+		# Writes gzip compressed, base64 encoded data to the text file f.
+		# Base64 is encoded in multiples of three bytes so that the pieces
+		# concatenate to the same result as encoding everything at once.
+		compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+		pending = b""
+		with open(self._spool_filename, "rb") as spool:
+			while True:
+				chunk = spool.read(self._CHUNK_SIZE)
+				if len(chunk) == 0:
+					break
+				pending += compressor.compress(chunk)
+				usable = len(pending) - (len(pending) % 3)
+				f.write(base64.b64encode(pending[:usable]).decode("ascii"))
+				pending = pending[usable:]
+		pending += compressor.flush()
+		f.write(base64.b64encode(pending).decode("ascii"))
+
+	def discard(self):
+		if (not self._moved) and os.path.exists(self._spool_filename):
+			os.unlink(self._spool_filename)
+
+	@property
+	def sha256(self):
+		return self._hash.hexdigest()
+
+	def _inline_data(self):
+		return self.placeholder
+
 class TMCJSONEncoder(json.JSONEncoder):
 	def default(self, obj):
 		return obj.to_repr()
@@ -0,0 +1,83 @@
+#	rigolrdout - Read data and screenshots from Rigol oscilloscopes
+#	Copyright (C) 2012-2018 Johannes Bauer
+#
+#	This file is part of rigolrdout.
+#
+#	rigolrdout is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; this program is ONLY licensed under
+#	version 3 of the License, later versions are explicitly excluded.
+#
+#	rigolrdout is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with rigolrdout; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#	Johannes Bauer <JohannesBauer@gmx.de>
+
+import os
+import json
+
+class TransferCheckpoint(object):
+	# Stores the raw data of all completely transferred windows of a waveform
+	# download, together with an identity of the acquisition it belongs to
+	# (preamble, trigger position and timebase). A later download of an
+	# acquisition with identical identity can resume after the last complete
+	# window. Two acquisitions with identical settings and trigger position
+	# have the same identity, so the caller compares saved data against the
+	# instrument before resuming.
+	def __init__(self, filename, identity, window_size):
+		self._filename = filename
+		self._meta_filename = filename + ".json"
+		self._identity = identity
+		self._window_size = window_size
+
+	def resumable_length(self, total_length):
+		# Length of all completely transferred windows of a previous download
+		# with the same identity, 0 if there is none.
+		try:
+			with open(self._meta_filename) as f:
+				meta = json.load(f)
+			length = os.path.getsize(self._filename)
+		except (FileNotFoundError, json.JSONDecodeError):
+			return 0
+		if (meta.get("identity") != self._identity) or (meta.get("window_size") != self._window_size) or (length > total_length):
+			return 0
+		# A window might have been written only partially when interrupted.
+		# The last window of a finished transfer is usually shorter.
+		if length == total_length:
+			return length
+		return length - (length % self._window_size)
+
+	def read(self, offset, length):
+		with open(self._filename, "rb") as f:
+			f.seek(offset)
+			return f.read(length)
+
+	def load(self, raw_data, length):
+		# Appends the first length bytes of saved data to raw_data (a
+		# bytearray or anything else that can be extended), window by window.
+		with open(self._filename, "rb") as f:
+			for offset in range(0, length, self._window_size):
+				raw_data.extend(f.read(min(self._window_size, length - offset)))
+
+	def start(self, length):
+		# Keeps the first length bytes of a previous transfer, if any
+		with open(self._meta_filename, "w") as f:
+			json.dump({ "identity": self._identity, "window_size": self._window_size }, f)
+		with open(self._filename, "ab") as f:
+			f.truncate(length)
+
+	def append(self, data):
+		with open(self._filename, "ab") as f:
+			f.write(data)
+
+	@staticmethod
+	def remove(filename):
+		for filename in [ filename, filename + ".json" ]:
+			if os.path.exists(filename):
+				os.unlink(filename)
@@ -0,0 +1,203 @@
+#	rigolrdout - Read data and screenshots from Rigol oscilloscopes
+#	Copyright (C) 2012-2018 Johannes Bauer
+#
+#	This file is part of rigolrdout.
+#
+#	rigolrdout is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; this program is ONLY licensed under
+#	version 3 of the License, later versions are explicitly excluded.
+#
+#	rigolrdout is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with rigolrdout; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#	Johannes Bauer <JohannesBauer@gmx.de>
+
+import numpy
+
+class UnsupportedWaveformException(Exception): pass
+
+# numpy view onto a stored waveform blob. Conversion of sample codes to volts
+# and of sample indices to seconds uses the same formulas as the gnuplot
+# waveform output of RigolWaveformInterpreter.
+class WaveformData(object):
+	_DEFAULT_CHUNK_SIZE = 1024 * 1024
+	_BLOCK_SIZE = 64
+
+	def __init__(self, inputfile, name, meta, data):
+		if meta["format"] != "BYTE":
+			raise UnsupportedWaveformException("Waveform %s has format %s, only BYTE is supported." % (name, meta["format"]))
+		self._name = name
+		self._meta = meta
+		self._raw = numpy.frombuffer(data, dtype = numpy.uint8)
+		self._trigger_position = inputfile["acquisition_info"]["trigger"]["position"]
+		self._histogram = None
+		self._block_extremes = None
+
+	@classmethod
+	def iter_input(cls, inputfile):
+		for (name, meta, data) in inputfile.iter_waveform():
+			yield cls(inputfile, name, meta, data)
+
+	@property
+	def name(self):
+		return self._name
+
+	@property
+	def meta(self):
+		return self._meta
+
+	@property
+	def channel(self):
+		return self._meta["channel"]
+
+	@property
+	def raw(self):
+		return self._raw
+
+	@property
+	def points(self):
+		return len(self._raw)
+
+	@property
+	def x_increment(self):
+		return self._meta["x_increment"]["flt"]
+
+	@property
+	def y_increment(self):
+		return self._meta["y_increment"]["flt"]
+
+	@property
+	def y_zero_code(self):
+		return self._meta["y_origin"]["flt"] + self._meta["y_reference"]
+
+	def _scan(self):
+		# The record is swept only once: besides the histogram of sample codes,
+		# the minimum and maximum of every block of samples are kept. Searching
+		# for transitions then only needs to revisit the blocks that straddle a
+		# threshold. bincount converts its input to intp, hence chunks.
+		if self._histogram is None:
+			histogram = numpy.zeros(256, dtype = numpy.int64)
+			(block_min, block_max) = ([ numpy.zeros(0, dtype = numpy.uint8) ], [ numpy.zeros(0, dtype = numpy.uint8) ])
+			for (offset, chunk) in self.iter_chunks():
+				histogram += numpy.bincount(chunk, minlength = 256)
+				boundaries = numpy.arange(0, len(chunk), self._BLOCK_SIZE)
+				block_min.append(numpy.minimum.reduceat(chunk, boundaries))
+				block_max.append(numpy.maximum.reduceat(chunk, boundaries))
+			self._histogram = histogram
+			self._block_extremes = (numpy.concatenate(block_min), numpy.concatenate(block_max))
+
+	def histogram(self):
+		self._scan()
+		return self._histogram
+
+	def base_top_codes(self):
+		# Top and base are the most frequent codes in the upper and lower half
+		# of the value range, falling back to the extremes.
+		histogram = self.histogram()
+		present = numpy.flatnonzero(histogram)
+		(min_code, max_code) = (int(present[0]), int(present[-1]))
+		split = (min_code + max_code) // 2 + 1
+		base_code = int(numpy.argmax(histogram[:split]))
+		top_code = split + int(numpy.argmax(histogram[split:])) if (split < len(histogram)) else max_code
+		if histogram[top_code] == 0:
+			top_code = max_code
+		return (base_code, top_code)
+
+	def to_code(self, volts):
+		return volts / self.y_increment + self.y_zero_code
+
+	def to_volts(self, codes):
+		return (numpy.asarray(codes, dtype = numpy.float64) - self.y_zero_code) * self.y_increment
+
+	def to_index(self, seconds):
+		# Fractional sample index at the given time relative to the trigger
+		return seconds / self.x_increment + self._meta["x_origin"]["flt"] + self._meta["x_reference"] + self._trigger_position - 1
+
+	def to_seconds(self, indices):
+		# Indices may be fractional (interpolated crossings)
+		indices = numpy.asarray(indices, dtype = numpy.float64) - self._trigger_position + 1
+		return (indices - self._meta["x_origin"]["flt"] - self._meta["x_reference"]) * self.x_increment
+
+	def iter_chunks(self, chunk_size = None):
+		# Chunks are views into the underlying buffer, nothing is copied
+		if chunk_size is None:
+			chunk_size = self._DEFAULT_CHUNK_SIZE
+		for offset in range(0, self.points, chunk_size):
+			yield (offset, self._raw[offset : offset + chunk_size])
+
+	@staticmethod
+	def _run_boundaries(marks, states):
+		# Only the first and last sample of every run of equal states can be
+		# part of a transition.
+		change = states[1:] != states[:-1]
+		keep = numpy.zeros(len(states), dtype = bool)
+		keep[0] = keep[-1] = True
+		keep[:-1] |= change
+		keep[1:] |= change
+		return (marks[keep], states[keep])
+
+	def _decisive_marks(self, low_code, high_code):
+		# Returns the indices and states (True if at or above high_code) of
+		# all samples that may be part of a transition, in order. Blocks that
+		# are entirely above or below the band contribute their first and last
+		# sample, blocks entirely within the band nothing; only the remaining
+		# blocks are read again.
+		self._scan()
+		(block_min, block_max) = self._block_extremes
+		block_above = block_min >= high_code
+		constant = block_above | (block_max <= low_code)
+		within_band = (block_min > low_code) & (block_max < high_code)
+		straddling = numpy.flatnonzero(~(constant | within_band))
+		constant = numpy.flatnonzero(constant)
+		marks = [ constant * self._BLOCK_SIZE, numpy.minimum((constant + 1) * self._BLOCK_SIZE, self.points) - 1 ]
+		states = [ block_above[constant], block_above[constant] ]
+
+		blocks_per_step = self._DEFAULT_CHUNK_SIZE // self._BLOCK_SIZE
+		within_block = numpy.arange(self._BLOCK_SIZE)
+		for offset in range(0, len(straddling), blocks_per_step):
+			blocks = straddling[offset : offset + blocks_per_step]
+			indices = numpy.minimum((blocks[:, numpy.newaxis] * self._BLOCK_SIZE + within_block).ravel(), self.points - 1)
+			samples = self._raw[indices]
+			above = samples >= high_code
+			decisive = above | (samples <= low_code)
+			if numpy.any(decisive):
+				(step_marks, step_states) = self._run_boundaries(indices[decisive], above[decisive])
+				marks.append(step_marks)
+				states.append(step_states)
+
+		marks = numpy.concatenate(marks)
+		order = numpy.argsort(marks, kind = "stable")
+		return (marks[order], numpy.concatenate(states)[order])
+
+	def find_transitions(self, low_code, high_code):
+		# Hysteresis edge detection: a rising transition leaves the band at or
+		# below low_code and arrives at or above high_code, a falling one does
+		# the opposite. Returns three arrays: the interpolated (fractional)
+		# sample index at which the signal crossed the first threshold, the
+		# one at which it crossed the second threshold and a boolean array
+		# that is True for rising transitions.
+		(marks, states) = self._decisive_marks(low_code, high_code)
+		if len(marks) == 0:
+			empty = numpy.zeros(0)
+			return (empty, empty, numpy.zeros(0, dtype = bool))
+
+		changes = numpy.flatnonzero(states[1:] != states[:-1])
+		prev_mark = marks[changes]
+		cur_mark = marks[changes + 1]
+		rising = states[changes + 1]
+
+		raw = self._raw
+		leave_threshold = numpy.where(rising, low_code, high_code)
+		arrive_threshold = numpy.where(rising, high_code, low_code)
+		(y0, y1) = (raw[prev_mark].astype(numpy.float64), raw[prev_mark + 1].astype(numpy.float64))
+		t_leave = prev_mark + (y0 - leave_threshold) / (y0 - y1)
+		(y0, y1) = (raw[cur_mark - 1].astype(numpy.float64), raw[cur_mark].astype(numpy.float64))
+		t_arrive = (cur_mark - 1) + (y0 - arrive_threshold) / (y0 - y1)
+		return (t_leave, t_arrive, rising)
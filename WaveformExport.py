@@ -0,0 +1,116 @@
+#	rigolrdout - Read data and screenshots from Rigol oscilloscopes
+#	Copyright (C) 2012-2018 Johannes Bauer
+#
+#	This file is part of rigolrdout.
+#
+#	rigolrdout is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; this program is ONLY licensed under
+#	version 3 of the License, later versions are explicitly excluded.
+#
+#	rigolrdout is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with rigolrdout; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#	Johannes Bauer <JohannesBauer@gmx.de>
+
+import numpy
+from WaveformData import WaveformData
+
+class ExportException(Exception): pass
+
+class WaveformExporter(object):
+	_ROWS_PER_CHUNK = 1024 * 1024
+
+	def __init__(self, args, inputfile):
+		self._args = args
+		self._input = inputfile
+		self._waveforms = list(WaveformData.iter_input(self._input))
+		if len(self._waveforms) == 0:
+			raise ExportException("No waveforms to export.")
+		reference = self._waveforms[0]
+		for waveform in self._waveforms[1:]:
+			if (waveform.points != reference.points) or (waveform.x_increment != reference.x_increment):
+				raise ExportException("Channel %d and channel %d do not share a common time base, cannot export them as one table." % (reference.channel, waveform.channel))
+		self._columns = [ "time" ] + [ "ch%d" % (waveform.channel) for waveform in self._waveforms ]
+		self._dtype = numpy.dtype([ ("time", numpy.float64) ] + [ (name, numpy.float32) for name in self._columns[1:] ])
+
+	@property
+	def points(self):
+		return self._waveforms[0].points
+
+	def _time_offset(self):
+		if self._args.honor_offsets:
+			return self._input["acquisition_info"]["timebase"]["offset"]["flt"]
+		return 0
+
+	def _voltage_offset(self, waveform):
+		if self._args.honor_offsets:
+			return self._input["channel_info"][str(waveform.channel)]["offset"]["flt"]
+		return 0
+
+	def _volts_lookup(self, waveform):
+		# 8-bit samples can only take 256 distinct values; converting through
+		# a lookup table is much cheaper than doing arithmetic per sample.
+		return (waveform.to_volts(numpy.arange(256)) + self._voltage_offset(waveform)).astype(numpy.float32)
+
+	def iter_chunks(self):
+		# Yields structured arrays of at most _ROWS_PER_CHUNK rows, so memory
+		# use does not depend on the memory depth.
+		lookups = [ self._volts_lookup(waveform) for waveform in self._waveforms ]
+		time_offset = self._time_offset()
+		for start in range(0, self.points, self._ROWS_PER_CHUNK):
+			end = min(start + self._ROWS_PER_CHUNK, self.points)
+			chunk = numpy.empty(end - start, dtype = self._dtype)
+			chunk["time"] = self._waveforms[0].to_seconds(numpy.arange(start, end)) - time_offset
+			for (name, waveform, lookup) in zip(self._columns[1:], self._waveforms, lookups):
+				chunk[name] = lookup[waveform.raw[start : end]]
+			yield chunk
+
+	def _write_csv(self, filename):
+		lookups = [ [ "%.7g" % (value) for value in self._volts_lookup(waveform).tolist() ] for waveform in self._waveforms ]
+		time_offset = self._time_offset()
+		with open(filename, "w") as f:
+			print(",".join(self._columns), file = f)
+			for start in range(0, self.points, self._ROWS_PER_CHUNK):
+				end = min(start + self._ROWS_PER_CHUNK, self.points)
+				times = (self._waveforms[0].to_seconds(numpy.arange(start, end)) - time_offset).tolist()
+				columns = [ map("%.10e".__mod__, times) ]
+				for (waveform, lookup) in zip(self._waveforms, lookups):
+					columns.append(map(lookup.__getitem__, waveform.raw[start : end].tolist()))
+				f.write("".join(",".join(row) + "\n" for row in zip(*columns)))
+
+	def _write_npy(self, filename):
+		with open(filename, "wb") as f:
+			numpy.lib.format.write_array_header_1_0(f, {
+				"descr":			numpy.lib.format.dtype_to_descr(self._dtype),
+				"fortran_order":	False,
+				"shape":			(self.points, ),
+			})
+			for chunk in self.iter_chunks():
+				f.write(chunk.tobytes())
+
+	def _write_parquet(self, filename):
+		try:
+			import pyarrow
+			import pyarrow.parquet
+		except ImportError:
+			raise ExportException("Parquet export requires pyarrow to be installed.")
+		schema = pyarrow.schema([ (name, pyarrow.from_numpy_dtype(self._dtype[name])) for name in self._columns ])
+		with pyarrow.parquet.ParquetWriter(filename, schema) as writer:
+			for chunk in self.iter_chunks():
+				writer.write_table(pyarrow.Table.from_arrays([ chunk[name] for name in self._columns ], schema = schema))
+
+	def write(self, filename, out_format):
+		assert(out_format in [ "csv", "npy", "parquet" ])
+		if out_format == "csv":
+			self._write_csv(filename)
+		elif out_format == "npy":
+			self._write_npy(filename)
+		elif out_format == "parquet":
+			self._write_parquet(filename)
@@ -0,0 +1,138 @@
+#	rigolrdout - Read data and screenshots from Rigol oscilloscopes
+#	Copyright (C) 2012-2018 Johannes Bauer
+#
+#	This file is part of rigolrdout.
+#
+#	rigolrdout is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; this program is ONLY licensed under
+#	version 3 of the License, later versions are explicitly excluded.
+#
+#	rigolrdout is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with rigolrdout; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#	Johannes Bauer <JohannesBauer@gmx.de>
+
+import json
+import numpy
+from WaveformData import WaveformData
+
+class WaveformMeasurement(object):
+	_LOW_REFERENCE = 0.1
+	_MID_REFERENCE = 0.5
+	_HIGH_REFERENCE = 0.9
+
+	def __init__(self, waveform):
+		self._waveform = waveform
+
+	def _levels(self):
+		# All amplitude statistics are derived from a single 256-bin
+		# histogram of the raw sample codes.
+		histogram = self._waveform.histogram()
+		codes = numpy.arange(len(histogram), dtype = numpy.float64)
+		present = numpy.flatnonzero(histogram)
+		(base_code, top_code) = self._waveform.base_top_codes()
+
+		count = histogram.sum()
+		offset_codes = codes - self._waveform.y_zero_code
+		mean_code = (histogram * codes).sum() / count
+		rms = numpy.sqrt((histogram * offset_codes ** 2).sum() / count) * abs(self._waveform.y_increment)
+		return {
+			"min_code":		int(present[0]),
+			"max_code":		int(present[-1]),
+			"base_code":	base_code,
+			"top_code":		top_code,
+			"mean_code":	mean_code,
+			"rms":			rms,
+		}
+
+	def _timing(self, base_code, top_code):
+		amplitude = top_code - base_code
+		result = {
+			"rising_edges":		0,
+			"falling_edges":	0,
+			"period":			None,
+			"frequency":		None,
+			"rise_time":		None,
+			"fall_time":		None,
+			"positive_width":	None,
+			"negative_width":	None,
+			"duty_cycle":		None,
+		}
+		if amplitude < 2:
+			# No edges can be told apart from quantization noise.
+			return result
+
+		low_code = base_code + self._LOW_REFERENCE * amplitude
+		high_code = base_code + self._HIGH_REFERENCE * amplitude
+		(t_leave, t_arrive, rising) = self._waveform.find_transitions(low_code, high_code)
+		falling = ~rising
+		t_mid = t_leave + (t_arrive - t_leave) * ((self._MID_REFERENCE - self._LOW_REFERENCE) / (self._HIGH_REFERENCE - self._LOW_REFERENCE))
+		x_increment = self._waveform.x_increment
+
+		result["rising_edges"] = int(rising.sum())
+		result["falling_edges"] = int(falling.sum())
+		if result["rising_edges"] > 0:
+			result["rise_time"] = float((t_arrive[rising] - t_leave[rising]).mean()) * x_increment
+		if result["falling_edges"] > 0:
+			result["fall_time"] = float((t_arrive[falling] - t_leave[falling]).mean()) * x_increment
+
+		# Transitions strictly alternate, so every pair of consecutive mid
+		# crossings is one pulse.
+		widths = numpy.diff(t_mid)
+		pulse_is_positive = rising[:-1]
+		if numpy.any(pulse_is_positive):
+			result["positive_width"] = float(widths[pulse_is_positive].mean()) * x_increment
+		if numpy.any(~pulse_is_positive):
+			result["negative_width"] = float(widths[~pulse_is_positive].mean()) * x_increment
+
+		rising_mid = t_mid[rising]
+		if len(rising_mid) >= 2:
+			period = float(rising_mid[-1] - rising_mid[0]) / (len(rising_mid) - 1) * x_increment
+			result["period"] = period
+			result["frequency"] = 1 / period
+			if result["positive_width"] is not None:
+				result["duty_cycle"] = result["positive_width"] / period * 100
+		return result
+
+	def measure(self):
+		levels = self._levels()
+		to_volts = lambda code: float(self._waveform.to_volts(code))
+		(vmax, vmin) = (to_volts(levels["max_code"]), to_volts(levels["min_code"]))
+		(vtop, vbase) = (to_volts(levels["top_code"]), to_volts(levels["base_code"]))
+		result = {
+			"channel":		self._waveform.channel,
+			"points":		self._waveform.points,
+			"vmax":			vmax,
+			"vmin":			vmin,
+			"vpp":			vmax - vmin,
+			"vtop":			vtop,
+			"vbase":		vbase,
+			"vamp":			vtop - vbase,
+			"vavg":			to_volts(levels["mean_code"]),
+			"vrms":			float(levels["rms"]),
+			"overshoot":	None,
+		}
+		if levels["top_code"] != levels["base_code"]:
+			result["overshoot"] = (vmax - vtop) / (vtop - vbase) * 100
+		result.update(self._timing(levels["base_code"], levels["top_code"]))
+		return result
+
+class MeasurementWriter(object):
+	def __init__(self, args, inputfile):
+		self._args = args
+		self._input = inputfile
+
+	def measure(self):
+		return { str(waveform.channel): WaveformMeasurement(waveform).measure() for waveform in WaveformData.iter_input(self._input) }
+
+	def write(self, filename, out_format):
+		assert(out_format in [ "json" ])
+		with open(filename, "w") as f:
+			print(json.dumps(self.measure(), sort_keys = True, indent = 4), file = f)
@@ -0,0 +1,242 @@
+#	rigolrdout - Read data and screenshots from Rigol oscilloscopes
+#	Copyright (C) 2012-2018 Johannes Bauer
+#
+#	This file is part of rigolrdout.
+#
+#	rigolrdout is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; this program is ONLY licensed under
+#	version 3 of the License, later versions are explicitly excluded.
+#
+#	rigolrdout is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with rigolrdout; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#	Johannes Bauer <JohannesBauer@gmx.de>
+
+import os
+import json
+import math
+import numpy
+from GnuplotRenderer import GnuplotRenderer
+from InputFile import InputFile, RigolWaveformInterpreter
+from Profiler import Profiler
+from WaveformData import WaveformData
+
+class WaveformPyramid(object):
+	# Minimum and maximum of every 16, 256, 4096, ... samples of each
+	# waveform. Stored next to a capture as an index (_pyramid.json) and the
+	# levels themselves (_pyramid.bin), which are mapped instead of read so
+	# that rendering only touches the entries it actually needs.
+	FACTOR = 16
+	_CHUNK_SIZE = FACTOR * 65536
+
+	def __init__(self, index, data_filename):
+		self._index = index
+		self._data_filename = data_filename
+
+	@staticmethod
+	def sidecar_filenames(capture_filename):
+		return (InputFile.sidecar_filename(capture_filename, "_pyramid.json"), InputFile.sidecar_filename(capture_filename, "_pyramid.bin"))
+
+	@classmethod
+	def _reduce(cls, mins, maxs):
+		# Groups of FACTOR entries, the last one may be incomplete
+		groups = (len(mins) + cls.FACTOR - 1) // cls.FACTOR
+		pad = groups * cls.FACTOR - len(mins)
+		if pad > 0:
+			mins = numpy.concatenate([ mins, numpy.full(pad, 255, dtype = numpy.uint8) ])
+			maxs = numpy.concatenate([ maxs, numpy.zeros(pad, dtype = numpy.uint8) ])
+		return (mins.reshape(groups, cls.FACTOR).min(axis = 1), maxs.reshape(groups, cls.FACTOR).max(axis = 1))
+
+	@classmethod
+	def _build_levels(cls, raw):
+		levels = [ ]
+		(mins, maxs) = ([ ], [ ])
+		for offset in range(0, len(raw), cls._CHUNK_SIZE):
+			chunk = raw[offset : offset + cls._CHUNK_SIZE]
+			(chunk_mins, chunk_maxs) = cls._reduce(chunk, chunk)
+			mins.append(chunk_mins)
+			maxs.append(chunk_maxs)
+		(mins, maxs) = (numpy.concatenate(mins), numpy.concatenate(maxs))
+		decimation = cls.FACTOR
+		while True:
+			levels.append((decimation, numpy.column_stack([ mins, maxs ])))
+			if len(mins) <= cls.FACTOR:
+				break
+			(mins, maxs) = cls._reduce(mins, maxs)
+			decimation *= cls.FACTOR
+		return levels
+
+	@classmethod
+	def build(cls, capture_filename, blobs):
+		# blobs yields (name, sha256, data) of every waveform. The SHA256 of
+		# the raw data is recorded so that outdated pyramids are recognized.
+		(index_filename, data_filename) = cls.sidecar_filenames(capture_filename)
+		index = {
+			"factor":	cls.FACTOR,
+			"waveforms": { },
+		}
+		with open(data_filename, "wb") as f:
+			for (name, sha256, data) in blobs:
+				raw = numpy.frombuffer(data, dtype = numpy.uint8)
+				if len(raw) == 0:
+					continue
+				entry = {
+					"sha256":	sha256,
+					"points":	len(raw),
+					"levels":	[ ],
+				}
+				for (decimation, level) in cls._build_levels(raw):
+					entry["levels"].append({
+						"decimation":	decimation,
+						"offset":		f.tell(),
+						"length":		len(level),
+					})
+					f.write(level.tobytes())
+				index["waveforms"][name] = entry
+		with open(index_filename, "w") as f:
+			json.dump(index, f, sort_keys = True, indent = 4)
+		return cls(index, data_filename)
+
+	@classmethod
+	def build_for_input(cls, inputfile):
+		def blobs():
+			for (name, blob_data) in inputfile.iter_type_meta("waveform"):
+				data = inputfile.get_storage(name)
+				if data is not None:
+					yield (name, blob_data["sha256"], data)
+		return cls.build(inputfile.filename, blobs())
+
+	@classmethod
+	def load(cls, capture_filename):
+		# Returns None if there is no pyramid for the capture
+		(index_filename, data_filename) = cls.sidecar_filenames(capture_filename)
+		if not (os.path.isfile(index_filename) and os.path.isfile(data_filename)):
+			return None
+		with open(index_filename) as f:
+			index = json.load(f)
+		if index.get("factor") != cls.FACTOR:
+			return None
+		return cls(index, data_filename)
+
+	def covers(self, name, sha256):
+		return (name in self._index["waveforms"]) and (self._index["waveforms"][name]["sha256"] == sha256)
+
+	def level(self, name, samples_per_entry):
+		# Coarsest level with at most samples_per_entry samples per entry as
+		# (decimation, array of (min, max) rows), or None if even the finest
+		# level is too coarse.
+		result = None
+		for level in self._index["waveforms"][name]["levels"]:
+			if level["decimation"] <= samples_per_entry:
+				result = level
+		if result is None:
+			return None
+		data = numpy.memmap(self._data_filename, dtype = numpy.uint8, mode = "r", offset = result["offset"], shape = (result["length"], 2))
+		return (result["decimation"], data)
+
+class PyramidWaveformPlot(RigolWaveformInterpreter):
+	# Waveform plot of the time range given by --x-range. Its cost depends on
+	# the number of output pixels only: every pixel column is drawn as the
+	# min/max envelope of the pyramid level that is just fine enough, raw
+	# samples are only read once there are fewer than 16 per pixel.
+	def __init__(self, args, inputfile):
+		# Deliberately does not load the waveforms like the base class does
+		GnuplotRenderer.__init__(self, args, inputfile)
+		self._waveforms = list(self._input.iter_type_meta("waveform"))
+		self._pyramid = self._get_pyramid()
+
+	def _get_pyramid(self):
+		pyramid = WaveformPyramid.load(self._input.filename)
+		if (pyramid is not None) and all(pyramid.covers(name, blob_data["sha256"]) for (name, blob_data) in self._waveforms):
+			return pyramid
+		# Build it once; all following plots of this capture are quick
+		with Profiler.stage("build pyramid"):
+			try:
+				return WaveformPyramid.build_for_input(self._input)
+			except OSError as e:
+				print("Cannot store pyramid next to %s (%s), rendering from raw data." % (self._input.filename, str(e)))
+				return None
+
+	def _render_waveform(self, name, blob_data):
+		# Returns ("raw", rows of (x, y)) or ("envelope", rows of (x, ymin,
+		# ymax)), or None if the waveform has no samples in the range.
+		# Only the conversions of WaveformData are used, the data is read
+		# separately.
+		waveform = WaveformData(self._input, name, blob_data["meta"], b"")
+		(t_start, t_end) = self._args.x_range
+		first = max(int(math.floor(waveform.to_index(t_start))), 0)
+		last = min(int(math.ceil(waveform.to_index(t_end))) + 1, blob_data["length"])
+		if last - first < 2:
+			return None
+		samples_per_pixel = (last - first) / self._args.width
+
+		level = None
+		if (self._pyramid is not None) and self._pyramid.covers(name, blob_data["sha256"]):
+			level = self._pyramid.level(name, samples_per_pixel)
+		if level is None:
+			data = self._input.read_range(name, first, last)
+			if data is None:
+				return None
+			raw = numpy.frombuffer(data, dtype = numpy.uint8)
+			x = waveform.to_seconds(numpy.arange(first, last))
+			return ("raw", numpy.column_stack([ x, waveform.to_volts(raw) ]))
+
+		(decimation, entries) = level
+		(first_entry, last_entry) = (first // decimation, (last + decimation - 1) // decimation)
+		entries = entries[first_entry : last_entry]
+		columns = min(self._args.width, len(entries))
+		boundaries = (numpy.arange(columns) * len(entries)) // columns
+		mins = numpy.minimum.reduceat(entries[:, 0], boundaries)
+		maxs = numpy.maximum.reduceat(entries[:, 1], boundaries)
+		# Every column is placed at the center of the samples it covers
+		column_starts = (first_entry + boundaries) * decimation
+		column_ends = numpy.minimum(numpy.append(column_starts[1:], last_entry * decimation), blob_data["length"])
+		x = waveform.to_seconds((column_starts + column_ends - 1) / 2)
+		return ("envelope", numpy.column_stack([ x, waveform.to_volts(mins), waveform.to_volts(maxs) ]))
+
+	def write_gpl(self, f):
+		(xunit, xunit_value) = self._get_unit(self._args.x_unit)
+		(yunit, yunit_value) = self._get_unit(self._args.y_unit)
+		rendered = [ ]
+		for (name, blob_data) in self._waveforms:
+			with Profiler.stage("render %s" % (name)):
+				result = self._render_waveform(name, blob_data)
+			if result is not None:
+				rendered.append((blob_data["meta"], result))
+
+		print("# %d waveform(s)" % (len(rendered)), file = f)
+		self._write_gpl_header(f)
+		print("set xlabel \"x / %ss\"" % (xunit), file = f)
+		print("set ylabel \"y / %sV\"" % (yunit), file = f)
+		print("set ytics nomirror", file = f)
+		print("set grid", file = f)
+		print("set autoscale xfix", file = f)
+		plotcmds = [ ]
+		for (meta, (kind, rows)) in rendered:
+			single_cmd = [ "'-' using" ]
+			if kind == "raw":
+				single_cmd.append(":".join("(%s)" % (column) for column in self._plot_columns(meta, xunit_value, yunit_value)))
+				single_cmd.append("with lines")
+			else:
+				single_cmd.append(":".join("(%s)" % (column) for column in self._plot_columns(meta, xunit_value, yunit_value, y_columns = 2)))
+				single_cmd.append("with filledcurves")
+			single_cmd.append("title \"Channel %d\"" % (meta["channel"]))
+			single_cmd.append("lc \"#%s\"" % (self._waveform_color(meta["channel"])))
+			if kind == "raw":
+				single_cmd.append("lw 2")
+			plotcmds.append(" ".join(single_cmd))
+		if len(plotcmds) == 0:
+			raise Exception("No waveform has samples in the requested range.")
+		print("plot %s" % (", ".join(plotcmds)), file = f)
+		print(file = f)
+		for (meta, (kind, rows)) in rendered:
+			numpy.savetxt(f, rows, fmt = "%.4e")
+			print("end", file = f)
+			print(file = f)
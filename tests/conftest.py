@@ -0,0 +1,194 @@
+#	rigolrdout - Read data and screenshots from Rigol oscilloscopes
+#	Copyright (C) 2012-2018 Johannes Bauer
+#
+#	This file is part of rigolrdout.
+#
+#	rigolrdout is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; this program is ONLY licensed under
+#	version 3 of the License, later versions are explicitly excluded.
+#
+#	rigolrdout is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with rigolrdout; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#	Johannes Bauer <JohannesBauer@gmx.de>
+
+import os
+import sys
+import json
+import argparse
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import time
+import numpy
+from Connections import BaseConnection
+from TMCDataTypes import TMCFloat, TMCRawData, TMCJSONEncoder
+from OutputFile import OutputFile
+from WaveformData import WaveformData
+
+# Preamble of a DS1104Z: 1ns per sample, 10mV per code and code 100 at 0V.
+# The trigger is at sample 1000 of the record.
+X_INCREMENT = 1e-9
+Y_INCREMENT = 0.01
+Y_ZERO_CODE = 100
+TRIGGER_POSITION = 1000
+
+def waveform_metadata(channel_id, points):
+	return {
+		"type":				"waveform",
+		"channel":			channel_id,
+		"format":			"BYTE",
+		"waveform_type":	"RAW",
+		"points":			points,
+		"count":			1,
+		"x_increment":		TMCFloat("%e" % (X_INCREMENT)),
+		"x_origin":			TMCFloat("0"),
+		"x_reference":		0,
+		"y_increment":		TMCFloat("%e" % (Y_INCREMENT)),
+		"y_origin":			TMCFloat("%d" % (Y_ZERO_CODE - 20)),
+		"y_reference":		20,
+	}
+
+def expected_seconds(indices):
+	return (numpy.asarray(indices, dtype = numpy.float64) - TRIGGER_POSITION + 1) * X_INCREMENT
+
+def expected_volts(codes):
+	return (numpy.asarray(codes, dtype = numpy.float64) - Y_ZERO_CODE) * Y_INCREMENT
+
+def make_waveform(codes, channel_id = 1):
+	codes = numpy.asarray(codes, dtype = numpy.uint8)
+	# Same representation as in a capture file
+	meta = json.loads(json.dumps(waveform_metadata(channel_id, len(codes)), cls = TMCJSONEncoder))
+	inputfile = { "acquisition_info": { "trigger": { "position": TRIGGER_POSITION } } }
+	return WaveformData(inputfile, "waveform-ch%d" % (channel_id), meta, codes.tobytes())
+
+def trapezoid(low_samples, high_samples, periods, low_code = 50, high_code = 200, ramp_samples = 9):
+	# Pulse train with linear edges: every period consists of low_samples at
+	# low_code, ramp_samples rising, high_samples at high_code and
+	# ramp_samples falling.
+	ramp = numpy.linspace(low_code, high_code, ramp_samples + 2)[1 : -1]
+	period = numpy.concatenate([ numpy.full(low_samples, low_code), ramp, numpy.full(high_samples, high_code), ramp[::-1] ])
+	return numpy.tile(period, periods).round().astype(numpy.uint8)
+
+class FakeScopeConnection(BaseConnection):
+	# Simulated DS1104Z with channels 1 and 2 enabled that answers from
+	# memory. Every channel holds the same samples. The responses to the
+	# :WAV:DATA? requests whose (zero-based) numbers are in corrupt lack their
+	# last byte, like a transfer that lost data on the way. All commands are
+	# recorded.
+	def __init__(self, samples, corrupt = (), trigger_position = 1000):
+		BaseConnection.__init__(self)
+		self._samples = samples
+		self._corrupt = set(corrupt)
+		self._window = (1, len(samples))
+		self.settings = {
+			"*IDN?":			"RIGOL TECHNOLOGIES,DS1104Z,DS1ZA000000001,00.04.04",
+			":ACQ:TYPE?":		"NORM",
+			":ACQ:SRAT?":		"1.000000e+09",
+			":ACQ:MDEP?":		"AUTO",
+			":ACQ:AVER?":		"2",
+			":TIM:OFFS?":		"0.000000e+00",
+			":TIM:SCAL?":		"2.000000e-04",
+			":TIM:MODE?":		"MAIN",
+			":TRIG:MODE?":		"EDGE",
+			":TRIG:COUP?":		"DC",
+			":TRIG:SWE?":		"AUTO",
+			":TRIG:HOLD?":		"1.600000e-08",
+			":TRIG:NREJ?":		"0",
+			":TRIG:EDG:SOUR?":	"CHAN1",
+			":TRIG:EDG:SLOP?":	"POS",
+			":TRIG:EDG:LEV?":	"1.820000e+00",
+		}
+		for channel_id in range(1, 5):
+			self.settings.update({
+				":CHAN%d:DISP?" % (channel_id):	"1" if (channel_id <= 2) else "0",
+				":CHAN%d:BWL?" % (channel_id):	"OFF",
+				":CHAN%d:COUP?" % (channel_id):	"DC",
+				":CHAN%d:INV?" % (channel_id):	"0",
+				":CHAN%d:OFFS?" % (channel_id):	"-1.300000e+00",
+				":CHAN%d:RANG?" % (channel_id):	"8.000000e+00",
+				":CHAN%d:TCAL?" % (channel_id):	"0.000000e+00",
+				":CHAN%d:SCAL?" % (channel_id):	"1.000000e+00",
+				":CHAN%d:PROB?" % (channel_id):	"1.000000e+01",
+				":CHAN%d:UNIT?" % (channel_id):	"VOLT",
+				":CHAN%d:VERN?" % (channel_id):	"0",
+			})
+		# Changes with every acquisition, not part of the setup
+		self.state = {
+			":TRIG:STAT?":		"STOP",
+			":TRIG:POS?":		"%d" % (trigger_position),
+			":WAV:PRE?":		"0,2,%d,1,1.000000e-09,0,0,1.000000e-02,80,20" % (len(samples)),
+		}
+		self.commands = [ ]
+		self.data_requests = [ ]
+
+	def _write(self, data):
+		self._raw_write(data)
+
+	def _put_block(self, block):
+		self._put(("#9%09d" % (len(block))).encode("ascii") + block + b"\n")
+
+	def _raw_write(self, data):
+		command = data.decode("utf-8").strip()
+		self.commands.append(command)
+		if command in self.settings:
+			self._put((self.settings[command] + "\n").encode("utf-8"))
+		elif command in self.state:
+			self._put((self.state[command] + "\n").encode("utf-8"))
+		elif command == ":SYST:SET?":
+			self._put_block(json.dumps(self.settings, sort_keys = True).encode("utf-8"))
+		elif command.startswith(":WAV:STAR "):
+			self._window = (int(command.split()[1]), self._window[1])
+		elif command.startswith(":WAV:STOP "):
+			self._window = (self._window[0], int(command.split()[1]))
+		elif command == ":WAV:DATA?":
+			(start, stop) = self._window
+			block = self._samples[start - 1 : stop]
+			if len(self.data_requests) in self._corrupt:
+				block = block[:-1]
+			self.data_requests.append(self._window)
+			self._put_block(block)
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+	# The driver waits after every command and between transfer windows
+	monkeypatch.setattr(time, "sleep", lambda seconds: None)
+
+def plot_args(**kwargs):
+	args = {
+		"search_path":		None,
+		"max_memory":		None,
+		"x_range":			None,
+		"honor_offsets":	False,
+		"width":			1280,
+		"height":			960,
+	}
+	args.update(kwargs)
+	return argparse.Namespace(**args)
+
+@pytest.fixture
+def write_capture(tmp_path):
+	# Writes a capture of the given {channel_id: codes} through OutputFile and
+	# returns its filename as rigolplot would be given it.
+	def write(channels, file_format = "files", name = "capture", comment = None):
+		outfile = OutputFile()
+		outfile.connection = "tcpip:test"
+		outfile.comment = comment
+		outfile.channel_info = { str(channel_id): { "offset": TMCFloat("0") } for channel_id in channels }
+		outfile.acquisition_info = { "trigger": { "position": TRIGGER_POSITION }, "timebase": { "offset": TMCFloat("0") } }
+		for (channel_id, codes) in sorted(channels.items()):
+			codes = numpy.asarray(codes, dtype = numpy.uint8)
+			outfile.add_raw_data("waveform-ch%d" % (channel_id), TMCRawData(codes.tobytes(), "bin", waveform_metadata(channel_id, len(codes))))
+		filename = str(tmp_path / name)
+		outfile.write(file_format, filename)
+		outfile.close()
+		return filename + "_meta.json" if (file_format == "files") else filename
+	return write
@@ -0,0 +1,129 @@
+#	rigolrdout - Read data and screenshots from Rigol oscilloscopes
+#	Copyright (C) 2012-2018 Johannes Bauer
+#
+#	This file is part of rigolrdout.
+#
+#	rigolrdout is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; this program is ONLY licensed under
+#	version 3 of the License, later versions are explicitly excluded.
+#
+#	rigolrdout is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with rigolrdout; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#	Johannes Bauer <JohannesBauer@gmx.de>
+
+import os
+import sys
+import json
+import socket
+import tempfile
+import threading
+import subprocess
+import pytest
+from AcquisitionDaemon import AcquisitionDaemon, DaemonClient, DaemonException
+from Connections import Connection
+from conftest import FakeScopeConnection
+
+pytestmark = pytest.mark.usefixtures("no_sleep")
+
+SAMPLES = bytes(range(256)) * 40
+
+class ClosableFakeScopeConnection(FakeScopeConnection):
+	def close(self):
+		pass
+
+@pytest.fixture
+def socket_path():
+	# UNIX socket paths are limited to about 100 characters
+	with tempfile.TemporaryDirectory(prefix = "rigold") as directory:
+		yield os.path.join(directory, "rigold.sock")
+
+@pytest.fixture
+def connections(monkeypatch):
+	# Every established connection, by connection string
+	connections = { }
+	def establish(cls, conn_str):
+		connections[conn_str] = ClosableFakeScopeConnection(SAMPLES)
+		return connections[conn_str]
+	monkeypatch.setattr(Connection, "establish", classmethod(establish))
+	return connections
+
+@pytest.fixture
+def daemon(socket_path, connections):
+	daemon = AcquisitionDaemon(socket_path, [ "TCPIP:Scope1", "tcpip:scope2" ])
+	thread = threading.Thread(target = daemon.serve_forever)
+	thread.start()
+	yield daemon
+	daemon.shutdown()
+	thread.join()
+	daemon.server_close()
+
+def test_normalize():
+	assert Connection.normalize("TCPIP:DS1000Z") == "tcpip:ds1000z"
+	assert Connection.normalize("tcpip:192.168.1.4") == "tcpip:192.168.1.4"
+	with pytest.raises(Exception):
+		Connection.normalize("usb:ds1000z")
+
+def test_capture(tmp_path, socket_path, daemon, connections):
+	for conn_str in [ "tcpip:scope1", "TCPIP:SCOPE2", "Tcpip:Scope1" ]:
+		output = str(tmp_path / conn_str.replace(":", "_"))
+		assert DaemonClient(socket_path).capture({ "connect": conn_str, "output": output })["status"] == "ok"
+		with open(output + "_meta.json") as f:
+			assert sorted(json.load(f)["data"]) == [ "waveform-ch1", "waveform-ch2" ]
+	# One session per instrument, kept open between captures
+	assert sorted(connections) == [ "TCPIP:Scope1", "tcpip:scope2" ]
+	assert connections["TCPIP:Scope1"].commands.count("*IDN?") == 1
+	assert connections["TCPIP:Scope1"].commands.count(":STOP") == 2
+	assert ":RUN" not in connections["TCPIP:Scope1"].commands
+
+	with pytest.raises(DaemonException):
+		DaemonClient(socket_path).capture({ "connect": "tcpip:scope3", "output": output })
+	with pytest.raises(DaemonException):
+		DaemonClient(socket_path).capture({ "connect": "tcpip:scope1", "output": "relative" })
+
+@pytest.mark.parametrize("sweep, command", [ ("AUTO", ":RUN"), ("SINGLE", ":SING") ])
+def test_rearm(tmp_path, socket_path, daemon, connections, sweep, command):
+	daemon.connect_all()
+	conn = connections["TCPIP:Scope1"]
+	conn.settings[":TRIG:SWE?"] = sweep
+	DaemonClient(socket_path).capture({ "connect": "tcpip:scope1", "output": str(tmp_path / "output"), "rearm": True })
+	assert conn.commands[-1] == command
+	assert conn.commands.index(":STOP") < conn.commands.index(":WAV:DATA?")
+
+def test_stale_socket(socket_path):
+	# Left behind by a daemon that was killed
+	with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+		sock.bind(socket_path)
+	AcquisitionDaemon._remove_stale_socket(socket_path)
+	assert not os.path.exists(socket_path)
+	AcquisitionDaemon._remove_stale_socket(socket_path)
+
+def test_live_socket(socket_path):
+	with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+		sock.bind(socket_path)
+		sock.listen()
+		with pytest.raises(DaemonException):
+			AcquisitionDaemon._remove_stale_socket(socket_path)
+	assert os.path.exists(socket_path)
+
+def test_no_socket(socket_path):
+	with open(socket_path, "w") as f:
+		f.write("important")
+	with pytest.raises(DaemonException):
+		AcquisitionDaemon._remove_stale_socket(socket_path)
+	with open(socket_path) as f:
+		assert f.read() == "important"
+
+@pytest.mark.parametrize("option", [ [ "--settings-cache", "cache.json" ], [ "-w", "2" ], [ "--profile", "profile.json" ] ])
+def test_client_rejects_daemon_options(socket_path, option):
+	rigolrdout = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "rigolrdout")
+	result = subprocess.run([ sys.executable, rigolrdout, "-c", "tcpip:scope1", "-o", "output", "-d", socket_path ] + option, stderr = subprocess.PIPE)
+	assert result.returncode == 1
+	assert result.stderr.startswith(b"error: ")
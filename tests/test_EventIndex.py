@@ -0,0 +1,93 @@
+#	rigolrdout - Read data and screenshots from Rigol oscilloscopes
+#	Copyright (C) 2012-2018 Johannes Bauer
+#
+#	This file is part of rigolrdout.
+#
+#	rigolrdout is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; this program is ONLY licensed under
+#	version 3 of the License, later versions are explicitly excluded.
+#
+#	rigolrdout is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with rigolrdout; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#	Johannes Bauer <JohannesBauer@gmx.de>
+
+import json
+import numpy
+import pytest
+from EventIndex import EventIndex, EventIndexException
+from InputFile import InputFile
+from conftest import expected_seconds, expected_volts, plot_args
+
+def pulses_and_runts(periods = 3):
+	# Every period: 100 samples at base (code 50), a 30 sample pulse to the
+	# top (code 200), 100 samples at base and a 20 sample runt that only
+	# reaches code 120, below the 50% level (125). The record ends at base.
+	period = numpy.concatenate([ numpy.full(100, 50), numpy.full(30, 200), numpy.full(100, 50), numpy.full(20, 120) ])
+	return numpy.concatenate([ numpy.tile(period, periods), numpy.full(100, 50) ])
+
+def events(index, **kwargs):
+	return list(index.query(**kwargs))
+
+@pytest.fixture
+def index(write_capture):
+	capture = write_capture({ 1: pulses_and_runts(), 3: numpy.full(750, 50) })
+	return EventIndex.create(InputFile(plot_args(), capture))
+
+def test_pulses(index):
+	# Steps are crossed halfway between two samples
+	pulses = events(index, channel = 1)
+	assert [ start for (channel, start, width, positive) in pulses ] == pytest.approx(expected_seconds([ 99.5, 129.5, 349.5, 379.5, 599.5 ]))
+	assert [ width for (channel, start, width, positive) in pulses ] == pytest.approx([ 30e-9, 220e-9, 30e-9, 220e-9, 30e-9 ])
+	assert [ positive for (channel, start, width, positive) in pulses ] == [ True, False, True, False, True ]
+	assert events(index, channel = 3) == [ ]
+	assert index.capture == "capture_meta.json"
+
+def test_runts(index):
+	runts = events(index, kind = "runts")
+	assert len(runts) == 3
+	for (runt, period_start) in zip(runts, [ 0, 250, 500 ]):
+		(channel, start, width, positive) = runt
+		assert (channel, positive) == (1, True)
+		assert start == pytest.approx(float(expected_seconds(period_start + 229.5)), abs = 0.5e-9)
+		assert width == pytest.approx(20e-9, abs = 1e-9)
+
+def test_threshold(write_capture):
+	capture = write_capture({ 1: pulses_and_runts() })
+	index = EventIndex.create(InputFile(plot_args(), capture), threshold = float(expected_volts(100)))
+	# Runts now are pulses, and runts are only searched with automatic levels
+	assert len(events(index)) == 11
+	assert events(index, kind = "runts") == [ ]
+
+def test_query(index):
+	assert len(events(index)) == 5
+	assert len(events(index, polarity = "pos")) == 3
+	assert len(events(index, polarity = "neg")) == 2
+	assert len(events(index, min_width = 100e-9)) == 2
+	assert len(events(index, max_width = 100e-9)) == 3
+	assert len(events(index, polarity = "pos", min_width = 100e-9)) == 0
+	assert events(index, channel = 2) == [ ]
+
+def test_write_load(tmp_path, index):
+	(index_filename, data_filename) = EventIndex.sidecar_filenames(str(tmp_path / "capture_meta.json"))
+	assert (index_filename, data_filename) == (str(tmp_path / "capture_events.json"), str(tmp_path / "capture_events.bin"))
+	index.write(index_filename, data_filename)
+	loaded = EventIndex.load(index_filename)
+	for kind in [ "pulses", "runts" ]:
+		assert events(loaded, kind = kind) == events(index, kind = kind)
+
+	# Indices of the previous format have no separate data file
+	with open(index_filename) as f:
+		content = json.load(f)
+	del content["data"]
+	with open(index_filename, "w") as f:
+		json.dump(content, f)
+	with pytest.raises(EventIndexException):
+		EventIndex.load(index_filename)
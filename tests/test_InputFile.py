@@ -0,0 +1,73 @@
+#	rigolrdout - Read data and screenshots from Rigol oscilloscopes
+#	Copyright (C) 2012-2018 Johannes Bauer
+#
+#	This file is part of rigolrdout.
+#
+#	rigolrdout is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; this program is ONLY licensed under
+#	version 3 of the License, later versions are explicitly excluded.
+#
+#	rigolrdout is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with rigolrdout; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#	Johannes Bauer <JohannesBauer@gmx.de>
+
+import os
+import json
+import numpy
+import pytest
+from InputFile import InputFile
+from conftest import plot_args
+
+EXAMPLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "example")
+
+def resave(src_filename, dst_filename, **kwargs):
+	with open(src_filename) as f:
+		meta = json.load(f)
+	with open(dst_filename, "w") as f:
+		json.dump(meta, f, **kwargs)
+	return dst_filename
+
+def blobs(inputfile):
+	return { blob_name: bytes(data) for (blob_name, meta, data) in inputfile }
+
+# Compact and spread out variants of the same capture; the first one contains
+# no space after the colon.
+LAYOUTS = [
+	{ "separators": (",", ":") },
+	{ "indent": "\t", "separators": (" ,", " :  ") },
+	{ "indent": 4 },
+]
+
+@pytest.mark.parametrize("max_memory", [ 1, 256 * 1024 * 1024 ])
+@pytest.mark.parametrize("layout", LAYOUTS)
+def test_spooled_example(tmp_path, layout, max_memory):
+	example = os.path.join(EXAMPLE_DIR, "inline.json")
+	expected = blobs(InputFile(plot_args(), example))
+	assert len(expected) > 0
+
+	filename = resave(example, str(tmp_path / "inline.json"), **layout)
+	inputfile = InputFile(plot_args(max_memory = max_memory), filename)
+	assert blobs(inputfile) == expected
+
+@pytest.mark.parametrize("layout", LAYOUTS)
+def test_spooled_capture(monkeypatch, tmp_path, write_capture, layout):
+	# Chunks small enough that keys and values are split across them
+	monkeypatch.setattr(InputFile, "_CHUNK_SIZE", 7)
+	channels = { channel_id: numpy.random.default_rng(channel_id).integers(0, 256, 5000) for channel_id in [ 1, 2, 4 ] }
+	filename = resave(write_capture(channels, file_format = "json"), str(tmp_path / "resaved.json"), **layout)
+	inputfile = InputFile(plot_args(max_memory = 1), filename)
+	assert blobs(inputfile) == { "waveform-ch%d" % (channel_id): codes.astype(numpy.uint8).tobytes() for (channel_id, codes) in channels.items() }
+
+def test_metadata_only(write_capture):
+	filename = write_capture({ 1: numpy.arange(100) }, file_format = "json")
+	inputfile = InputFile(plot_args(), filename, metadata_only = True)
+	assert inputfile["data"]["waveform-ch1"]["length"] == 100
+	assert inputfile.get_storage("waveform-ch1") is None
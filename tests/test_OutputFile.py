@@ -0,0 +1,134 @@
+#	rigolrdout - Read data and screenshots from Rigol oscilloscopes
+#	Copyright (C) 2012-2018 Johannes Bauer
+#
+#	This file is part of rigolrdout.
+#
+#	rigolrdout is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; this program is ONLY licensed under
+#	version 3 of the License, later versions are explicitly excluded.
+#
+#	rigolrdout is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with rigolrdout; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#	Johannes Bauer <JohannesBauer@gmx.de>
+
+import os
+import json
+import concurrent.futures
+import numpy
+import pytest
+from OutputFile import OutputFile
+from InputFile import InputFile
+from TMCDataTypes import TMCRawData, TMCSpooledRawData
+from conftest import waveform_metadata, plot_args
+
+CHANNELS = { channel_id: numpy.random.default_rng(channel_id).integers(0, 256, 3000).astype(numpy.uint8).tobytes() for channel_id in [ 1, 2 ] }
+
+@pytest.fixture
+def executor():
+	with concurrent.futures.ThreadPoolExecutor(max_workers = 2) as executor:
+		yield executor
+
+def raw_data(tmp_path, channel_id, spooled):
+	if not spooled:
+		return TMCRawData(CHANNELS[channel_id], "bin", waveform_metadata(channel_id, len(CHANNELS[channel_id])))
+	raw_data = TMCSpooledRawData(str(tmp_path / ("ch%d.spool" % (channel_id))), "bin", waveform_metadata(channel_id, len(CHANNELS[channel_id])))
+	for offset in range(0, len(CHANNELS[channel_id]), 1000):
+		raw_data.extend(CHANNELS[channel_id][offset : offset + 1000])
+	raw_data.close()
+	return raw_data
+
+def output(tmp_path, executor = None, target = None, spooled = False):
+	outfile = OutputFile(executor = executor)
+	outfile.connection = "tcpip:test"
+	outfile.acquisition_info = { "trigger": { "position": 1000 } }
+	if target is not None:
+		outfile.prepare(*target)
+	for channel_id in sorted(CHANNELS):
+		outfile.add_raw_data("waveform-ch%d" % (channel_id), raw_data(tmp_path, channel_id, spooled))
+	return outfile
+
+def read_back(capture_filename):
+	# Metadata apart from the time of creation, and all blobs
+	with open(capture_filename) as f:
+		meta = json.load(f)
+	del meta["created"]
+	for blob_data in meta["data"].values():
+		blob_data.pop("gzip_compressed_data", None)
+	return (meta, { name: bytes(data) for (name, blob_meta, data) in InputFile(plot_args(), capture_filename) })
+
+def files_in(directory):
+	return sorted(os.listdir(str(directory)))
+
+@pytest.mark.parametrize("spooled", [ False, True ])
+@pytest.mark.parametrize("file_format", [ "files", "json" ])
+def test_background_processing(tmp_path, executor, file_format, spooled):
+	# Identical output whether data was processed in the background or not
+	(serial_dir, background_dir) = (tmp_path / "serial", tmp_path / "background")
+	os.mkdir(str(serial_dir))
+	os.mkdir(str(background_dir))
+	capture_filename = { "files": "output_meta.json", "json": "output" }[file_format]
+
+	outfile = output(serial_dir, spooled = spooled)
+	outfile.write(file_format, str(serial_dir / "output"))
+	outfile.close()
+
+	outfile = output(background_dir, executor = executor, target = (file_format, str(background_dir / "output")), spooled = spooled)
+	outfile.write(file_format, str(background_dir / "output"))
+	outfile.close()
+
+	assert read_back(str(serial_dir / capture_filename)) == read_back(str(background_dir / capture_filename))
+	assert files_in(serial_dir) == files_in(background_dir)
+	(meta, blobs) = read_back(str(background_dir / capture_filename))
+	assert blobs == { "waveform-ch%d" % (channel_id): data for (channel_id, data) in CHANNELS.items() }
+
+def test_staged_files(tmp_path, executor):
+	outfile = output(tmp_path, executor = executor, target = ("files", str(tmp_path / "output")))
+	concurrent.futures.wait(outfile._pending)
+	# Written in the background, but not yet under their final name
+	assert files_in(tmp_path) == [ "output_waveform-ch1.bin.tmp", "output_waveform-ch2.bin.tmp" ]
+	outfile.write("files", str(tmp_path / "output"))
+	assert files_in(tmp_path) == [ "output_meta.json", "output_waveform-ch1.bin", "output_waveform-ch2.bin" ]
+	outfile.close()
+	assert files_in(tmp_path) == [ "output_meta.json", "output_waveform-ch1.bin", "output_waveform-ch2.bin" ]
+
+@pytest.mark.parametrize("spooled", [ False, True ])
+def test_aborted(tmp_path, executor, spooled):
+	# Closed without being written, like a capture that failed
+	outfile = output(tmp_path, executor = executor, target = ("files", str(tmp_path / "output")), spooled = spooled)
+	outfile.close()
+	assert files_in(tmp_path) == [ ]
+
+def test_other_target(tmp_path, executor):
+	# Data processed for the prepared target is written again for another one
+	outfile = output(tmp_path, executor = executor, target = ("files", str(tmp_path / "output")))
+	outfile.write("files", str(tmp_path / "other"))
+	outfile.close()
+	assert files_in(tmp_path) == [ "other_meta.json", "other_waveform-ch1.bin", "other_waveform-ch2.bin" ]
+	(meta, blobs) = read_back(str(tmp_path / "other_meta.json"))
+	assert blobs == { "waveform-ch%d" % (channel_id): data for (channel_id, data) in CHANNELS.items() }
+
+def test_checkpoints(tmp_path):
+	checkpoint_filename = str(tmp_path / "output_ch1.partial")
+	for filename in [ checkpoint_filename, checkpoint_filename + ".json" ]:
+		with open(filename, "w") as f:
+			f.write("{ }")
+
+	# Kept when the output was not written
+	outfile = output(tmp_path)
+	outfile.add_checkpoint(checkpoint_filename)
+	outfile.close()
+	assert os.path.exists(checkpoint_filename)
+
+	outfile = output(tmp_path)
+	outfile.add_checkpoint(checkpoint_filename)
+	outfile.write("json", str(tmp_path / "output.json"))
+	outfile.close()
+	assert files_in(tmp_path) == [ "output.json" ]
@@ -0,0 +1,111 @@
+#	rigolrdout - Read data and screenshots from Rigol oscilloscopes
+#	Copyright (C) 2012-2018 Johannes Bauer
+#
+#	This file is part of rigolrdout.
+#
+#	rigolrdout is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; this program is ONLY licensed under
+#	version 3 of the License, later versions are explicitly excluded.
+#
+#	rigolrdout is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with rigolrdout; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#	Johannes Bauer <JohannesBauer@gmx.de>
+
+import io
+import numpy
+import pytest
+from Persistence import PersistenceHistogram, PersistencePlot
+from conftest import make_waveform, expected_seconds, expected_volts, plot_args
+
+def step_codes():
+	# 500 samples at -0.5V, 500 samples at +0.5V
+	return numpy.concatenate([ numpy.full(500, 50), numpy.full(500, 150) ])
+
+def step_histogram(**kwargs):
+	# Ten columns of 100 samples each (bin edges half a sample off the sample
+	# times) and four rows of 0.5V from -1V to 1V.
+	x_range = (float(expected_seconds(-0.5)), float(expected_seconds(999.5)))
+	return PersistenceHistogram(width = 10, height = 4, x_range = x_range, y_range = (-1, 1), **kwargs)
+
+def persistence_args(**kwargs):
+	args = {
+		"width":		10,
+		"height":		4,
+		"eye_period":	None,
+		"channel":		None,
+		"jobs":			1,
+		"x_unit":		None,
+		"y_unit":		None,
+	}
+	args.update(kwargs)
+	return plot_args(**args)
+
+def test_binning():
+	histogram = step_histogram()
+	histogram.add_waveform(make_waveform(step_codes()))
+	expected = numpy.zeros((4, 10), dtype = numpy.int64)
+	expected[1, :5] = 100
+	expected[3, 5:] = 100
+	assert histogram.hits.tolist() == expected.tolist()
+
+def test_out_of_range_samples():
+	# 1.55V and -1V: above the range and exactly on its lower edge
+	histogram = step_histogram()
+	histogram.add_waveform(make_waveform(numpy.concatenate([ numpy.full(500, 255), numpy.full(500, 0) ])))
+	assert histogram.hits.sum() == 500
+	assert histogram.hits[0, 5:].tolist() == [ 100 ] * 5
+
+def test_eye_folding():
+	histogram = PersistenceHistogram(width = 10, height = 4, x_range = (0, 100e-9), y_range = (-1, 1), eye_period = 100e-9)
+	histogram.add_waveform(make_waveform(step_codes()))
+	assert histogram.hits.sum() == 1000
+	assert histogram.hits.sum(axis = 1).tolist() == [ 0, 500, 0, 500 ]
+
+def test_merge():
+	(first, second, both) = (step_histogram(), step_histogram(), step_histogram())
+	(codes1, codes2) = (step_codes(), numpy.random.default_rng(5).integers(0, 256, 1000))
+	first.add_waveform(make_waveform(codes1))
+	second.add_waveform(make_waveform(codes2))
+	both.add_waveform(make_waveform(codes1))
+	both.add_waveform(make_waveform(codes2))
+	first.merge(second)
+	assert first.hits.tolist() == both.hits.tolist()
+
+def test_histogram_args():
+	plot = PersistencePlot(persistence_args(), [ "unused" ])
+	ranges = [ ((0, 1), (-1, 1)), ((-2, 0.5), (0, 3)) ]
+	assert plot._histogram_args(ranges)["x_range"] == (-2, 1)
+	assert plot._histogram_args(ranges)["y_range"] == (-1, 3)
+	plot = PersistencePlot(persistence_args(eye_period = 1e-6), [ "unused" ])
+	assert plot._histogram_args(ranges)["x_range"] == (0, 1e-6)
+	with pytest.raises(Exception):
+		plot._histogram_args([ ])
+
+@pytest.mark.parametrize("capture_format", [ "files", "json" ])
+def test_accumulate(write_capture, capture_format):
+	# Captures of different length: the plot covers the longest one
+	rng = numpy.random.default_rng(9)
+	filenames = [ write_capture({ 1: rng.integers(0, 256, points), 2: rng.integers(0, 256, points) }, file_format = capture_format, name = "capture%d" % (i), comment = "Capture %d" % (i)) for (i, points) in enumerate([ 1000, 3000, 2000, 500, 1000 ]) ]
+	histograms = [ PersistencePlot(persistence_args(jobs = jobs), filenames).accumulate() for jobs in [ 1, 2, 8 ] ]
+	assert histograms[0].x_range == (float(expected_seconds(0)), float(expected_seconds(3000)))
+	assert histograms[0].y_range == (float(expected_volts(0)), float(expected_volts(255)))
+	assert histograms[0].hits.sum() > 0
+	for histogram in histograms[1:]:
+		assert histogram.hits.tolist() == histograms[0].hits.tolist()
+
+	(channel1, channel2) = (PersistencePlot(persistence_args(channel = channel_id), filenames).accumulate() for channel_id in [ 1, 2 ])
+	channel1.merge(channel2)
+	assert channel1.hits.tolist() == histograms[0].hits.tolist()
+
+	plot = PersistencePlot(persistence_args(), filenames)
+	f = io.StringIO()
+	plot.write_gpl(f)
+	assert "set title \"Capture 0\"" in f.getvalue()
@@ -0,0 +1,115 @@
+#	rigolrdout - Read data and screenshots from Rigol oscilloscopes
+#	Copyright (C) 2012-2018 Johannes Bauer
+#
+#	This file is part of rigolrdout.
+#
+#	rigolrdout is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; this program is ONLY licensed under
+#	version 3 of the License, later versions are explicitly excluded.
+#
+#	rigolrdout is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with rigolrdout; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#	Johannes Bauer <JohannesBauer@gmx.de>
+
+import os
+import sys
+import json
+import time
+import pstats
+import threading
+import subprocess
+import pytest
+from Profiler import Profiler
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+@pytest.fixture(autouse = True)
+def profiler(monkeypatch):
+	# The profiler is process-wide, every test starts with a fresh one
+	monkeypatch.setattr(Profiler, "_enabled", False)
+	monkeypatch.setattr(Profiler, "_stages", [ ])
+	monkeypatch.setattr(Profiler, "_start", None)
+	monkeypatch.setattr(Profiler, "_cprofile", None)
+
+def test_disabled():
+	with Profiler.stage("nothing"):
+		pass
+	assert Profiler._stages == [ ]
+
+def test_stages(tmp_path):
+	Profiler.enable()
+	with Profiler.stage("outer"):
+		with Profiler.stage("inner"):
+			time.sleep(0.05)
+	with pytest.raises(ValueError):
+		with Profiler.stage("failing"):
+			raise ValueError()
+	def threaded():
+		with Profiler.stage("threaded"):
+			pass
+	thread = threading.Thread(target = threaded, name = "worker")
+	thread.start()
+	thread.join()
+
+	Profiler.write(json_filename = str(tmp_path / "profile.json"))
+	with open(str(tmp_path / "profile.json")) as f:
+		result = json.load(f)
+	stages = { stage["name"]: stage for stage in result["stages"] }
+	# Stages are recorded when they finish
+	assert [ stage["name"] for stage in result["stages"] ] == [ "inner", "outer", "failing", "threaded" ]
+	assert stages["inner"]["duration"] >= 0.05
+	assert stages["outer"]["duration"] >= stages["inner"]["duration"]
+	assert stages["outer"]["start"] <= stages["inner"]["start"]
+	assert stages["threaded"]["thread"] == "worker"
+	assert stages["inner"]["thread"] == threading.current_thread().name
+	for stage in result["stages"]:
+		assert stage["rss_high_water_kib"] > 0
+		assert stage["rss_high_water_growth_kib"] >= 0
+	assert result["total"] >= stages["outer"]["duration"]
+	assert result["rss_high_water_kib"] >= max(stage["rss_high_water_kib"] for stage in result["stages"])
+	assert "worker_rss_high_water_kib" in result
+
+def test_cprofile(tmp_path):
+	Profiler.enable(with_cprofile = True)
+	with Profiler.stage("profiled"):
+		sorted(range(1000), key = lambda value: -value)
+	Profiler.write(cprofile_filename = str(tmp_path / "profile.pstats"))
+	assert pstats.Stats(str(tmp_path / "profile.pstats")).total_calls > 0
+
+def test_rigolplot_profile(tmp_path):
+	profile_filename = str(tmp_path / "profile.json")
+	subprocess.check_call([ sys.executable, os.path.join(REPO_DIR, "rigolplot"), "-t", "measurements", "--profile", profile_filename, os.path.join(REPO_DIR, "example", "external_meta.json"), str(tmp_path / "measurements.json") ])
+	with open(profile_filename) as f:
+		result = json.load(f)
+	names = [ stage["name"] for stage in result["stages"] ]
+	assert "decode waveform-ch1" in names
+	assert names[-1] == "output measurements"
+
+def test_benchmark_regression(tmp_path):
+	rigolbench = [ sys.executable, os.path.join(REPO_DIR, "rigolbench"), "-d", "24000", "-r", "1" ]
+	baseline_filename = str(tmp_path / "baseline.json")
+	subprocess.check_call(rigolbench + [ "-o", baseline_filename ], stdout = subprocess.DEVNULL)
+	with open(baseline_filename) as f:
+		baseline = json.load(f)
+	assert "analysis/1x24000/measurements" in baseline
+	assert all(result["msamples_per_sec"] > 0 for result in baseline.values())
+
+	# Compared against itself with a generous tolerance, nothing regressed
+	assert subprocess.call(rigolbench + [ "-b", baseline_filename, "-t", "0.99" ], stdout = subprocess.DEVNULL) == 0
+
+	# Against a baseline that is a thousand times faster, everything did
+	for result in baseline.values():
+		result["msamples_per_sec"] *= 1000
+	with open(baseline_filename, "w") as f:
+		json.dump(baseline, f)
+	result = subprocess.run(rigolbench + [ "-b", baseline_filename ], stdout = subprocess.DEVNULL, stderr = subprocess.PIPE)
+	assert result.returncode == 1
+	assert result.stderr.count(b"Regression: ") == len(baseline)
@@ -0,0 +1,127 @@
+#	rigolrdout - Read data and screenshots from Rigol oscilloscopes
+#	Copyright (C) 2012-2018 Johannes Bauer
+#
+#	This file is part of rigolrdout.
+#
+#	rigolrdout is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; this program is ONLY licensed under
+#	version 3 of the License, later versions are explicitly excluded.
+#
+#	rigolrdout is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with rigolrdout; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#	Johannes Bauer <JohannesBauer@gmx.de>
+
+import os
+import numpy
+import pytest
+from Connections import ProtocolException
+from RigolDriver import RigolDriver
+from TMCDataTypes import TMCSpooledRawData
+from TransferCheckpoint import TransferCheckpoint
+from conftest import FakeScopeConnection
+
+WINDOW = 250000
+
+pytestmark = pytest.mark.usefixtures("no_sleep")
+
+@pytest.fixture
+def samples():
+	return numpy.random.default_rng(11).integers(0, 256, 2 * WINDOW + 100000).astype(numpy.uint8).tobytes()
+
+def windows(*indices):
+	return [ (1 + index * WINDOW, min((index + 1) * WINDOW, 2 * WINDOW + 100000)) for index in indices ]
+
+def test_transfer(samples):
+	conn = FakeScopeConnection(samples)
+	waveform = RigolDriver(conn).get_waveform(1)
+	assert bytes(waveform.data) == samples
+	assert waveform.metadata["points"] == len(samples)
+	assert conn.data_requests == windows(0, 1, 2)
+
+def test_retry(samples):
+	conn = FakeScopeConnection(samples, corrupt = [ 1 ])
+	waveform = RigolDriver(conn).get_waveform(1, retries = 1)
+	assert bytes(waveform.data) == samples
+	assert conn.data_requests == windows(0, 1, 1, 2)
+
+def test_retries_exhausted(samples):
+	conn = FakeScopeConnection(samples, corrupt = [ 1, 2 ])
+	with pytest.raises(ProtocolException):
+		RigolDriver(conn).get_waveform(1, retries = 1)
+
+def test_resume(tmp_path, samples):
+	checkpoint_filename = str(tmp_path / "output_ch1.partial")
+	with pytest.raises(ProtocolException):
+		RigolDriver(FakeScopeConnection(samples, corrupt = [ 1 ])).get_waveform(1, retries = 0, checkpoint_filename = checkpoint_filename)
+	assert os.path.getsize(checkpoint_filename) == WINDOW
+
+	# The last saved window is verified first
+	conn = FakeScopeConnection(samples)
+	waveform = RigolDriver(conn).get_waveform(1, checkpoint_filename = checkpoint_filename)
+	assert bytes(waveform.data) == samples
+	assert conn.data_requests == windows(0, 1, 2)
+
+	# Of a completely transferred channel, only the last window is verified
+	conn = FakeScopeConnection(samples)
+	waveform = RigolDriver(conn).get_waveform(1, checkpoint_filename = checkpoint_filename)
+	assert bytes(waveform.data) == samples
+	assert conn.data_requests == windows(2)
+
+	TransferCheckpoint.remove(checkpoint_filename)
+	assert not os.path.exists(checkpoint_filename)
+	assert not os.path.exists(checkpoint_filename + ".json")
+
+def test_resume_partial_window(tmp_path, samples):
+	# Data of an incompletely written window is discarded
+	checkpoint_filename = str(tmp_path / "output_ch1.partial")
+	with pytest.raises(ProtocolException):
+		RigolDriver(FakeScopeConnection(samples, corrupt = [ 2 ])).get_waveform(1, retries = 0, checkpoint_filename = checkpoint_filename)
+	with open(checkpoint_filename, "ab") as f:
+		f.write(samples[2 * WINDOW : 2 * WINDOW + 1000])
+
+	conn = FakeScopeConnection(samples)
+	assert bytes(RigolDriver(conn).get_waveform(1, checkpoint_filename = checkpoint_filename).data) == samples
+	assert conn.data_requests == windows(1, 2)
+
+def test_resume_other_acquisition(tmp_path, samples):
+	checkpoint_filename = str(tmp_path / "output_ch1.partial")
+	with pytest.raises(ProtocolException):
+		RigolDriver(FakeScopeConnection(samples, corrupt = [ 1 ])).get_waveform(1, retries = 0, checkpoint_filename = checkpoint_filename)
+
+	other_samples = bytes(reversed(samples))
+	conn = FakeScopeConnection(other_samples, trigger_position = 2000)
+	assert bytes(RigolDriver(conn).get_waveform(1, checkpoint_filename = checkpoint_filename).data) == other_samples
+	assert conn.data_requests == windows(0, 1, 2)
+
+def test_resume_retriggered(tmp_path, samples):
+	# Same settings and trigger position, but new samples
+	checkpoint_filename = str(tmp_path / "output_ch1.partial")
+	with pytest.raises(ProtocolException):
+		RigolDriver(FakeScopeConnection(samples, corrupt = [ 2 ])).get_waveform(1, retries = 0, checkpoint_filename = checkpoint_filename)
+
+	other_samples = samples[:WINDOW] + bytes(reversed(samples[WINDOW:]))
+	conn = FakeScopeConnection(other_samples)
+	assert bytes(RigolDriver(conn).get_waveform(1, checkpoint_filename = checkpoint_filename).data) == other_samples
+	assert conn.data_requests == windows(1, 0, 1, 2)
+	with open(checkpoint_filename, "rb") as f:
+		assert f.read() == other_samples
+
+def test_spooled_transfer(tmp_path, samples):
+	spool_filename = str(tmp_path / "output_ch1.spool")
+	waveform = RigolDriver(FakeScopeConnection(samples)).get_waveform(1, spool_filename = spool_filename, max_in_memory = WINDOW)
+	assert isinstance(waveform, TMCSpooledRawData)
+	assert bytes(waveform.data) == samples
+	waveform.discard()
+	assert not os.path.exists(spool_filename)
+
+	with pytest.raises(ProtocolException):
+		RigolDriver(FakeScopeConnection(samples, corrupt = [ 1 ])).get_waveform(1, retries = 0, spool_filename = spool_filename, max_in_memory = WINDOW)
+	assert not os.path.exists(spool_filename)
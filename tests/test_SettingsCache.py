@@ -0,0 +1,89 @@
+#	rigolrdout - Read data and screenshots from Rigol oscilloscopes
+#	Copyright (C) 2012-2018 Johannes Bauer
+#
+#	This file is part of rigolrdout.
+#
+#	rigolrdout is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; this program is ONLY licensed under
+#	version 3 of the License, later versions are explicitly excluded.
+#
+#	rigolrdout is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with rigolrdout; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#	Johannes Bauer <JohannesBauer@gmx.de>
+
+import json
+import pytest
+from Capture import Capture
+from RigolDriver import RigolDriver
+from SettingsCache import SettingsCache
+from conftest import FakeScopeConnection
+
+pytestmark = pytest.mark.usefixtures("no_sleep")
+
+SAMPLES = bytes(range(256)) * 40
+
+def capture(tmp_path, conn, settings_cache = None, name = "output"):
+	# Returns the written metadata, apart from the time of creation
+	outfile = Capture(RigolDriver(conn), "tcpip:test").acquire(settings_cache = settings_cache)
+	filename = str(tmp_path / name)
+	outfile.write("files", filename)
+	outfile.close()
+	with open(filename + "_meta.json") as f:
+		meta = json.load(f)
+	del meta["created"]
+	return meta
+
+def settings_queries(conn):
+	return [ command for command in conn.commands if command.startswith((":CHAN", ":ACQ:", ":TIM:")) ]
+
+def test_cached_output_identical(tmp_path):
+	uncached = capture(tmp_path, FakeScopeConnection(SAMPLES))
+	assert sorted(uncached["channel_info"]) == [ "1", "2" ]
+	settings_cache = SettingsCache(str(tmp_path / "cache.json"))
+
+	conn = FakeScopeConnection(SAMPLES)
+	assert capture(tmp_path, conn, settings_cache) == uncached
+	assert len(settings_queries(conn)) > 20
+
+	# Also when the cache is read from its file again
+	for settings_cache in [ settings_cache, SettingsCache(str(tmp_path / "cache.json")) ]:
+		conn = FakeScopeConnection(SAMPLES)
+		assert capture(tmp_path, conn, settings_cache) == uncached
+		assert conn.commands.count(":SYST:SET?") == 1
+		assert settings_queries(conn) == [ ]
+
+def test_cached_trigger_state(tmp_path):
+	settings_cache = SettingsCache(str(tmp_path / "cache.json"))
+	capture(tmp_path, FakeScopeConnection(SAMPLES), settings_cache)
+	conn = FakeScopeConnection(SAMPLES, trigger_position = 2000)
+	meta = capture(tmp_path, conn, settings_cache)
+	assert meta["acquisition_info"]["trigger"]["position"] == 2000
+	assert settings_queries(conn) == [ ]
+
+@pytest.mark.parametrize("query, value", [ (":CHAN1:VERN?", "1"), (":CHAN3:DISP?", "1"), (":TIM:SCAL?", "5.000000e-04"), (":TRIG:EDG:LEV?", "1.000000e+00") ])
+def test_changed_setting(tmp_path, query, value):
+	settings_cache = SettingsCache(str(tmp_path / "cache.json"))
+	capture(tmp_path, FakeScopeConnection(SAMPLES), settings_cache)
+
+	changed = FakeScopeConnection(SAMPLES)
+	changed.settings[query] = value
+	uncached = capture(tmp_path, changed)
+	changed = FakeScopeConnection(SAMPLES)
+	changed.settings[query] = value
+	assert capture(tmp_path, changed, settings_cache) == uncached
+	assert len(settings_queries(changed)) > 20
+
+def test_refresh(tmp_path):
+	settings_cache = SettingsCache(str(tmp_path / "cache.json"))
+	capture(tmp_path, FakeScopeConnection(SAMPLES), settings_cache)
+	conn = FakeScopeConnection(SAMPLES)
+	Capture(RigolDriver(conn), "tcpip:test").acquire(settings_cache = settings_cache, refresh_settings = True).close()
+	assert len(settings_queries(conn)) > 20
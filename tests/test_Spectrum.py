@@ -0,0 +1,60 @@
+#	rigolrdout - Read data and screenshots from Rigol oscilloscopes
+#	Copyright (C) 2012-2018 Johannes Bauer
+#
+#	This file is part of rigolrdout.
+#
+#	rigolrdout is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; this program is ONLY licensed under
+#	version 3 of the License, later versions are explicitly excluded.
+#
+#	rigolrdout is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with rigolrdout; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#	Johannes Bauer <JohannesBauer@gmx.de>
+
+import numpy
+import pytest
+from Spectrum import WelchSpectrum, SpectrumException
+from conftest import make_waveform, X_INCREMENT, Y_INCREMENT, Y_ZERO_CODE
+
+def integrated_power(spectrum):
+	(frequencies, psd, block_count) = spectrum.compute()
+	return psd.sum() * (frequencies[1] - frequencies[0])
+
+def test_sine_power_and_frequency():
+	# 1V amplitude sine exactly on bin 64 of a rectangular 1024 point FFT:
+	# practically all of its power (0.5 V^2, minus the effect of rounding
+	# to codes) ends up in that bin.
+	fft_size = 1024
+	indices = numpy.arange(64 * fft_size)
+	codes = (Y_ZERO_CODE + 100 * numpy.sin(2 * numpy.pi * 64 * indices / fft_size)).round()
+	spectrum = WelchSpectrum(make_waveform(codes), fft_size = fft_size, window = "rect")
+	(frequencies, psd, block_count) = spectrum.compute()
+	assert block_count == 127
+	assert frequencies[numpy.argmax(psd)] == pytest.approx(64 / (fft_size * X_INCREMENT))
+	assert integrated_power(spectrum) == pytest.approx(numpy.var(codes) * Y_INCREMENT ** 2)
+	assert psd[64] * (frequencies[1] - frequencies[0]) == pytest.approx(0.5, rel = 1e-2)
+
+@pytest.mark.parametrize("window", [ "hann", "hamming", "blackman", "rect" ])
+def test_noise_power(window):
+	# Parseval: the integrated PSD of white noise equals its variance, for
+	# every window.
+	codes = numpy.random.default_rng(1).integers(0, 256, 1 << 20)
+	expected_variance = numpy.var(codes) * Y_INCREMENT ** 2
+	spectrum = WelchSpectrum(make_waveform(codes), fft_size = 1024, window = window)
+	assert integrated_power(spectrum) == pytest.approx(expected_variance, rel = 0.02)
+
+def test_short_records():
+	spectrum = WelchSpectrum(make_waveform(numpy.arange(5)), fft_size = 16384)
+	assert spectrum.fft_size == 4
+	assert spectrum.compute()[2] == 1
+	for points in [ 0, 1, 3 ]:
+		with pytest.raises(SpectrumException):
+			WelchSpectrum(make_waveform(numpy.arange(points)), fft_size = 16384)
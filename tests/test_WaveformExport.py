@@ -0,0 +1,67 @@
+#	rigolrdout - Read data and screenshots from Rigol oscilloscopes
+#	Copyright (C) 2012-2018 Johannes Bauer
+#
+#	This file is part of rigolrdout.
+#
+#	rigolrdout is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; this program is ONLY licensed under
+#	version 3 of the License, later versions are explicitly excluded.
+#
+#	rigolrdout is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with rigolrdout; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#	Johannes Bauer <JohannesBauer@gmx.de>
+
+import numpy
+import pytest
+from WaveformExport import WaveformExporter, ExportException
+from InputFile import InputFile
+from conftest import expected_seconds, expected_volts, plot_args
+
+def load_csv(filename):
+	table = numpy.genfromtxt(filename, delimiter = ",", names = True)
+	return { name: table[name] for name in table.dtype.names }
+
+def load_npy(filename):
+	table = numpy.load(filename)
+	return { name: table[name] for name in table.dtype.names }
+
+def load_parquet(filename):
+	pyarrow_parquet = pytest.importorskip("pyarrow.parquet")
+	table = pyarrow_parquet.read_table(filename)
+	return { name: table.column(name).to_numpy() for name in table.column_names }
+
+@pytest.fixture
+def channels():
+	rng = numpy.random.default_rng(3)
+	return { 1: rng.integers(0, 256, 2500), 3: rng.integers(0, 256, 2500) }
+
+@pytest.mark.parametrize("capture_format", [ "files", "json" ])
+@pytest.mark.parametrize("max_memory", [ None, 1 ])
+@pytest.mark.parametrize("out_format, load", [ ("csv", load_csv), ("npy", load_npy), ("parquet", load_parquet) ])
+def test_round_trip(monkeypatch, tmp_path, write_capture, channels, capture_format, max_memory, out_format, load):
+	# Several chunks, the last one incomplete
+	monkeypatch.setattr(WaveformExporter, "_ROWS_PER_CHUNK", 1000)
+	args = plot_args(max_memory = max_memory)
+	inputfile = InputFile(args, write_capture(channels, file_format = capture_format))
+	filename = str(tmp_path / ("export." + out_format))
+	WaveformExporter(args, inputfile).write(filename, out_format)
+
+	table = load(filename)
+	assert sorted(table) == [ "ch1", "ch3", "time" ]
+	assert table["time"] == pytest.approx(expected_seconds(numpy.arange(2500)), rel = 1e-9)
+	for (channel_id, codes) in channels.items():
+		assert table["ch%d" % (channel_id)] == pytest.approx(expected_volts(codes), abs = 1e-6)
+
+def test_mismatched_time_base(write_capture):
+	args = plot_args()
+	inputfile = InputFile(args, write_capture({ 1: numpy.zeros(100), 2: numpy.zeros(200) }))
+	with pytest.raises(ExportException):
+		WaveformExporter(args, inputfile)
@@ -0,0 +1,107 @@
+#	rigolrdout - Read data and screenshots from Rigol oscilloscopes
+#	Copyright (C) 2012-2018 Johannes Bauer
+#
+#	This file is part of rigolrdout.
+#
+#	rigolrdout is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; this program is ONLY licensed under
+#	version 3 of the License, later versions are explicitly excluded.
+#
+#	rigolrdout is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with rigolrdout; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#	Johannes Bauer <JohannesBauer@gmx.de>
+
+import numpy
+import pytest
+from WaveformData import WaveformData
+from WaveformMeasurement import WaveformMeasurement
+from conftest import make_waveform, trapezoid
+
+def reference_transitions(raw, low_code, high_code):
+	# Sample by sample: (last sample in the old state, first sample in the
+	# new state, rising) for every change between at/below low_code and
+	# at/above high_code.
+	(state, last_index, result) = (None, None, [ ])
+	for (index, value) in enumerate(raw.tolist()):
+		if value >= high_code:
+			new_state = True
+		elif value <= low_code:
+			new_state = False
+		else:
+			continue
+		if (state is not None) and (new_state != state):
+			result.append((last_index, index, new_state))
+		(state, last_index) = (new_state, index)
+	return result
+
+@pytest.mark.parametrize("chunk_size", [ 128, 1024 * 1024 ])
+def test_pulse_train(monkeypatch, chunk_size):
+	# 20 periods of 100 samples: 61 low, 9 rising, 21 high, 9 falling. Edges
+	# are linear in steps of 15 codes, so that the 10% and 90% levels (65 and
+	# 185) fall exactly onto samples.
+	monkeypatch.setattr(WaveformData, "_DEFAULT_CHUNK_SIZE", chunk_size)
+	codes = trapezoid(61, 21, 20)
+	result = WaveformMeasurement(make_waveform(codes)).measure()
+
+	assert result["points"] == 2000
+	assert result["vmax"] == pytest.approx(1.0)
+	assert result["vmin"] == pytest.approx(-0.5)
+	assert result["vtop"] == pytest.approx(1.0)
+	assert result["vbase"] == pytest.approx(-0.5)
+	assert result["vamp"] == pytest.approx(1.5)
+	assert result["vpp"] == pytest.approx(1.5)
+	assert result["overshoot"] == pytest.approx(0)
+	# 61 * 50 + 21 * 200 + 2 * (65 + 80 + ... + 185) = 9500 per period
+	assert result["vavg"] == pytest.approx(-0.05)
+	assert result["vrms"] == pytest.approx(numpy.sqrt(numpy.mean((codes - 100.0) ** 2)) * 0.01)
+
+	assert result["rising_edges"] == 20
+	assert result["falling_edges"] == 20
+	assert result["rise_time"] == pytest.approx(8e-9)
+	assert result["fall_time"] == pytest.approx(8e-9)
+	assert result["period"] == pytest.approx(100e-9)
+	assert result["frequency"] == pytest.approx(10e6)
+	assert result["positive_width"] == pytest.approx(30e-9)
+	assert result["negative_width"] == pytest.approx(70e-9)
+	assert result["duty_cycle"] == pytest.approx(30)
+
+def test_flat_line():
+	result = WaveformMeasurement(make_waveform(numpy.full(500, 120))).measure()
+	assert result["vmax"] == result["vmin"] == pytest.approx(0.2)
+	assert result["rising_edges"] == result["falling_edges"] == 0
+	assert result["period"] is None
+	assert result["overshoot"] is None
+
+def test_find_transitions_exact():
+	# Rising from code 10 to 90 in steps of 20, thresholds between samples
+	codes = numpy.array([ 10, 10, 30, 50, 70, 90, 90, 50, 10 ], dtype = numpy.uint8)
+	(t_leave, t_arrive, rising) = make_waveform(codes).find_transitions(20, 80)
+	assert rising.tolist() == [ True, False ]
+	assert t_leave.tolist() == pytest.approx([ 1.5, 6.25 ])
+	assert t_arrive.tolist() == pytest.approx([ 4.5, 7.75 ])
+
+@pytest.mark.parametrize("seed", range(5))
+def test_find_transitions_against_reference(monkeypatch, seed):
+	# Noisy pulses across many blocks and chunks, including thresholds that
+	# coincide with sample codes and a record that ends within a block.
+	monkeypatch.setattr(WaveformData, "_DEFAULT_CHUNK_SIZE", 256)
+	rng = numpy.random.default_rng(seed)
+	points = 5000 + seed * 37
+	square = numpy.sign(numpy.sin(numpy.arange(points) / rng.uniform(5, 100)))
+	codes = (128 + 80 * square + rng.normal(0, 20, points)).clip(0, 255).astype(numpy.uint8)
+	(low_code, high_code) = (100, 150.5)
+	(t_leave, t_arrive, rising) = make_waveform(codes).find_transitions(low_code, high_code)
+
+	expected = reference_transitions(codes, low_code, high_code)
+	assert rising.tolist() == [ new_state for (last_index, index, new_state) in expected ]
+	for (leave, arrive, (last_index, index, new_state)) in zip(t_leave, t_arrive, expected):
+		assert last_index <= leave <= last_index + 1
+		assert index - 1 <= arrive <= index
@@ -0,0 +1,84 @@
+#	rigolrdout - Read data and screenshots from Rigol oscilloscopes
+#	Copyright (C) 2012-2018 Johannes Bauer
+#
+#	This file is part of rigolrdout.
+#
+#	rigolrdout is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; this program is ONLY licensed under
+#	version 3 of the License, later versions are explicitly excluded.
+#
+#	rigolrdout is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with rigolrdout; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#	Johannes Bauer <JohannesBauer@gmx.de>
+
+import numpy
+import pytest
+from InputFile import InputFile
+from WaveformPyramid import WaveformPyramid, PyramidWaveformPlot
+from conftest import plot_args, expected_seconds, expected_volts
+
+@pytest.mark.parametrize("points", [ 1, 15, 16, 17, 5000, 70000 ])
+def test_levels_match_raw_data(monkeypatch, write_capture, points):
+	# Chunks of 64 samples while building, so that chunk boundaries and an
+	# incomplete last entry are covered.
+	monkeypatch.setattr(WaveformPyramid, "_CHUNK_SIZE", 4 * WaveformPyramid.FACTOR)
+	raw = numpy.random.default_rng(points).integers(0, 256, points).astype(numpy.uint8)
+	capture = write_capture({ 1: raw })
+	inputfile = InputFile(plot_args(), capture)
+	WaveformPyramid.build_for_input(inputfile)
+
+	pyramid = WaveformPyramid.load(capture)
+	assert pyramid.covers("waveform-ch1", inputfile["data"]["waveform-ch1"]["sha256"])
+	assert not pyramid.covers("waveform-ch1", "0" * 64)
+	assert pyramid.level("waveform-ch1", WaveformPyramid.FACTOR - 1) is None
+	decimation = WaveformPyramid.FACTOR
+	while True:
+		(level_decimation, entries) = pyramid.level("waveform-ch1", decimation)
+		assert level_decimation == decimation
+		expected = [ (raw[start : start + decimation].min(), raw[start : start + decimation].max()) for start in range(0, points, decimation) ]
+		assert entries.tolist() == [ list(entry) for entry in expected ]
+		if len(entries) <= WaveformPyramid.FACTOR:
+			break
+		decimation *= WaveformPyramid.FACTOR
+	# Asking for an even coarser level returns the coarsest one
+	assert pyramid.level("waveform-ch1", decimation * WaveformPyramid.FACTOR)[0] == decimation
+
+@pytest.mark.parametrize("capture_format", [ "files", "json" ])
+def test_read_range(write_capture, capture_format):
+	raw = numpy.random.default_rng(7).integers(0, 256, 3000).astype(numpy.uint8)
+	inputfile = InputFile(plot_args(), write_capture({ 2: raw }, file_format = capture_format))
+	assert bytes(inputfile.read_range("waveform-ch2", 1000, 1500)) == raw[1000 : 1500].tobytes()
+	assert bytes(inputfile.read_range("waveform-ch2", 2900, 3100)) == raw[2900 : ].tobytes()
+
+def test_render(write_capture):
+	# 4096 samples of 1ns, trigger at sample 1000 (0s)
+	raw = numpy.random.default_rng(3).integers(0, 256, 4096).astype(numpy.uint8)
+	capture = write_capture({ 1: raw })
+
+	# Few samples per pixel: raw samples from 100ns to 200ns after the trigger
+	plot = PyramidWaveformPlot(plot_args(x_range = (100e-9, 200e-9)), InputFile(plot_args(), capture))
+	(name, blob_data) = plot._waveforms[0]
+	(kind, rows) = plot._render_waveform(name, blob_data)
+	assert kind == "raw"
+	assert rows[:, 0] == pytest.approx(expected_seconds(numpy.arange(1099, 1200)))
+	assert rows[:, 1] == pytest.approx(expected_volts(raw[1099 : 1200]))
+
+	# Whole record on 128 pixels: two pyramid entries of 16 samples each per
+	# column
+	plot = PyramidWaveformPlot(plot_args(x_range = (-1e-6, 4e-6), width = 128), InputFile(plot_args(), capture))
+	(kind, rows) = plot._render_waveform(name, blob_data)
+	assert kind == "envelope"
+	assert len(rows) == 128
+	assert rows[:, 0] == pytest.approx(expected_seconds(numpy.arange(128) * 32 + 15.5))
+	assert rows[:, 1] == pytest.approx(expected_volts(raw.reshape(128, 32).min(axis = 1)))
+	assert rows[:, 2] == pytest.approx(expected_volts(raw.reshape(128, 32).max(axis = 1)))
+
+	assert PyramidWaveformPlot(plot_args(x_range = (1e-3, 2e-3)), InputFile(plot_args(), capture))._render_waveform(name, blob_data) is None